@@ -243,7 +243,7 @@ def train_3d_cnn(
         )
         dst.set_attr("kind", "raw")
         with DatasetManager(dst, out=dst, dtype="float32", fillvalue=0) as DM:
-            DM.out[:] = proposal.copy()
+            DM.out[:] = proposal
 
 
 @pipelines.get("/predict_3d_cnn", response_model=None)
@@ -315,4 +315,4 @@ def predict_3d_cnn(
         )
         dst.set_attr("kind", "raw")
         with DatasetManager(dst, out=dst, dtype="float32", fillvalue=0) as DM:
-            DM.out[:] = proposal.copy()
+            DM.out[:] = proposal
@@ -184,32 +184,41 @@ def delete_level(workspace: str, level: str, full: bool = False):
 
 
 @annotations.get("/add_label")
-def add_label(workspace: str, level: str, full: bool = False):
+def add_label(workspace: str, level: str, full: bool = False, count: int = 1):
     from survos2.api.annotate import erase_label
     from survos2.improc.utils import map_blocks
 
     ds = get_level(workspace, level, full)
     labels = ds.get_metadata("labels", {})
-    idx = max(1, (max(l for l in labels) if labels else 1)) + 1  # change min label to 1
-    # idx = max(0, (max(l for l in labels) if labels else 0))   # change min label to 1
-
-    if idx >= 16:
-        existing_idx = set(labels.keys())
-        for i in range(1, 16):
-            if i not in existing_idx:
-                idx = i
-                break
-        if idx >= 16:
-            raise ValueError("Only 15 labels can be created")
+    new_labels = []
+
+    for _ in range(count):
+        idx = max(1, (max(l for l in labels) if labels else 1)) + 1  # change min label to 1
+        # idx = max(0, (max(l for l in labels) if labels else 0))   # change min label to 1
 
-    new_label = to_label(idx=idx)
-    labels[idx] = new_label
+        if idx >= 16:
+            existing_idx = set(labels.keys())
+            for i in range(1, 16):
+                if i not in existing_idx:
+                    idx = i
+                    break
+            if idx >= 16:
+                raise ValueError("Only 15 labels can be created")
+
+        new_label = to_label(idx=idx)
+        labels[idx] = new_label
+        new_labels.append(new_label)
+
+    # Single metadata write for the whole batch
     ds.set_metadata("labels", labels)
 
-    # Erase label from dataset
-    erase_label(ds, label=idx)
+    # Erase labels from dataset
+    for new_label in new_labels:
+        erase_label(ds, label=new_label["idx"])
 
-    return new_label
+    if count == 1:
+        return new_labels[0]
+    return new_labels
 
 
 @annotations.get("/get_labels")
@@ -23,6 +23,11 @@ from fastapi import APIRouter, Query
 
 roi = APIRouter()
 
+# Cache of the roi_fnames metadata dict keyed by dataset URI, so frequent
+# /existing requests don't re-open the dataset and re-parse its attribute
+# db. Every writer in this module refreshes the entry it touches.
+_roi_fnames_cache = {}
+
 
 @roi.get("/create")
 def create(
@@ -38,7 +43,9 @@ def create(
         anno_ds = ws.get_dataset(
             original_workspace, original_level, group="annotations", session="default"
         )
-        anno_ds_crop = anno_ds[roi[0] : roi[1], roi[2] : roi[3], roi[4] : roi[5]] & 15
+        anno_ds_crop = (anno_ds[roi[0] : roi[1], roi[2] : roi[3], roi[4] : roi[5]] & 15).astype(
+            np.uint8, copy=False
+        )
         original_labels = get_labels(original_workspace, original_level)
     roi_dict = {}
     DataModel.g.current_workspace = workspace
@@ -52,31 +59,20 @@ def create(
     with DatasetManager(src, out=None, dtype="float32", fillvalue=0) as DM:
         src_dataset = DM.sources[0]
         ds_metadata = src_dataset.get_metadata()
-
-        if not "roi_fnames" in ds_metadata:
-            src_dataset.set_metadata("roi_fnames", roi_dict)
-        else:
-            roi_dict = src_dataset.get_metadata("roi_fnames")
-        num_entries = len(roi_dict.keys())
-        roi_dict[num_entries + 1] = roi_fname
+        roi_dict = ds_metadata.get("roi_fnames", roi_dict)
+        roi_dict[len(roi_dict.keys()) + 1] = roi_fname
         src_dataset.set_metadata("roi_fnames", roi_dict)
+        _roi_fnames_cache[src] = roi_dict
         metadata = dict()
         metadata["id"] = len(roi_dict.keys())
         metadata["name"] = roi_fname
 
     if original_level != "None":
-        label_values = np.unique(anno_ds_crop)
-
-        for v in label_values:
-            if v != 0:
-                params = dict(
-                    level="001_level",
-                    idx=int(v) - 2,
-                    name=str(int(v) - 2),
-                    color="#11FF11",
-                    workspace=True,
-                )
-                label_result = add_label(workspace=roi_fname, level="001_level")
+        counts = np.bincount(anno_ds_crop.ravel(), minlength=16)
+        label_values = np.nonzero(counts)[0]
+        num_labels = int(np.sum(label_values != 0))
+        if num_labels:
+            add_label(workspace=roi_fname, level="001_level", count=num_labels)
 
         levels_result = get_single_level(roi_fname, level="001_level")
 
@@ -112,22 +108,29 @@ def pull_anno(roi_fname: str, anno_id="001_level", target_anno_id="001_level"):
 
     dst = DataModel.g.dataset_uri(target_anno_id, group="annotations")
     main_anno = dataset_from_uri(dst, mode="rw")
-    main_anno[z_min:z_max, x_min:x_max, y_min:y_max] = ds[:]
+    # Stream slab-by-slab along z, aligned to the source chunking, rather
+    # than materializing the whole ROI in one read.
+    chunk_size = getattr(ds, "chunk_size", None)
+    step = chunk_size[0] if chunk_size else z_max - z_min
+    for z0 in range(0, z_max - z_min, step):
+        z1 = min(z0 + step, z_max - z_min)
+        main_anno[z_min + z0 : z_min + z1, x_min:x_max, y_min:y_max] = ds[z0:z1]
 
 
 @roi.get("/existing")
 def existing():
     src = DataModel.g.dataset_uri("__data__")
-    with DatasetManager(src, out=None, dtype="float32", fillvalue=0) as DM:
-        src_dataset = DM.sources[0]
-        ds_metadata = src_dataset.get_metadata()
-
-        if not "roi_fnames" in ds_metadata:
-            src_dataset.set_metadata("roi_fnames", {})
-            return {}
-
-        roi_fnames = ds_metadata["roi_fnames"]
-        return roi_fnames
+    if src in _roi_fnames_cache:
+        return _roi_fnames_cache[src]
+    # Metadata-only read: open the dataset read-only rather than paying
+    # for a full DatasetManager with a float32 output path.
+    ds = dataset_from_uri(src, mode="r")
+    try:
+        roi_fnames = ds.get_metadata("roi_fnames", {}) if ds.supports_metadata() else {}
+    finally:
+        ds.close()
+    _roi_fnames_cache[src] = roi_fnames
+    return roi_fnames
 
 
 @roi.get("/remove")
@@ -141,3 +144,4 @@ def remove(workspace: str, roi_fname: str):
                 selected = k
         del roi_fnames[selected]
         src_dataset.set_metadata("roi_fnames", roi_fnames)
+        _roi_fnames_cache[src] = roi_fnames
@@ -36,21 +36,40 @@ def _unpack_lists(input_list):
 
 
 def rescale_denan(img):
-    img = img - np.min(img)
-    img = img / np.max(img)
-    img = np.nan_to_num(img)
+    img = np.ascontiguousarray(img, dtype=np.float32)
+    np.nan_to_num(img, copy=False)
+    mn = img.min()
+    mx = img.max()
+    inv = np.float32(1.0 / (mx - mn)) if mx > mn else np.float32(0)
+    np.subtract(img, mn, out=img)
+    np.multiply(img, inv, out=img)
     return img
 
-def simple_norm(dst):
+def simple_norm(dst, slab_size=64):
+    # Pass 1: reduce the dataset slab-by-slab to a global min/max, then
+    # pass 2: normalize chunk-wise through map_blocks. Peak memory stays
+    # at O(slab) rather than materializing the whole volume.
+    mn = np.inf
+    mx = -np.inf
     with DatasetManager(dst, out=None, dtype="float32", fillvalue=0) as DM:
-        arr = DM.sources[0][:]
-        arr -= np.min(arr)
-        arr /= np.max(arr)
-    map_blocks(pass_through, arr, out=dst, normalize=False)
+        ds = DM.sources[0]
+        for i in range(0, ds.shape[0], slab_size):
+            slab = ds[i : i + slab_size]
+            mn = min(mn, np.min(slab))
+            mx = max(mx, np.max(slab))
+    inv = np.float32(1.0 / (mx - mn)) if mx > mn else np.float32(0)
+    map_blocks(normalize_chunk, dst, out=dst, normalize=False, mn=np.float32(mn), inv=inv)
 
 
 
 
+def normalize_chunk(x, mn=0.0, inv=1.0):
+    x = x.astype(np.float32, copy=True)
+    np.subtract(x, mn, out=x)
+    np.multiply(x, inv, out=x)
+    return x
+
+
 def pass_through(x):
     return x
 
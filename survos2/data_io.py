@@ -1,4 +1,5 @@
 from functools import lru_cache
+import os
 import re
 import os.path as op
 import copy
@@ -82,6 +83,19 @@ def dataset_from_uri(uri, mode="a", shape=None, dtype="float32", fill=0):
         raise ValueError("Wrong URI. Only hdf5:// and survos:// uris are supported.")
 
 
+# HDF5 chunk cache settings applied to every file opened through
+# hdf5_from_uri. The h5py defaults (1 MiB, 521 slots) thrash as soon as a
+# sliced read spans more than a handful of chunks; a larger cache keeps the
+# working set of repeat reads in memory. rdcc_nbytes is an upper bound, so
+# memory is only consumed by chunks actually cached. Overridable via
+# environment for constrained machines.
+HDF5_CACHE_OPTS = dict(
+    rdcc_nbytes=int(os.environ.get("SURVOS_HDF5_CACHE_BYTES", 256 * 1024 * 1024)),
+    rdcc_nslots=int(os.environ.get("SURVOS_HDF5_CACHE_SLOTS", 100003)),
+    rdcc_w0=float(os.environ.get("SURVOS_HDF5_CACHE_W0", 0.75)),
+)
+
+
 def hdf5_from_uri(uri, mode="a", shape=None, dtype="float32", fill=0):
     """
     Loads an HDF5 dataset from an uri of the form:
@@ -115,11 +129,11 @@ def hdf5_from_uri(uri, mode="a", shape=None, dtype="float32", fill=0):
     dpath = match.group("dspath") or "/data"
 
     if mode in ["r", "r+", "a"]:
-        f = h5.File(fpath, mode)
+        f = h5.File(fpath, mode, **HDF5_CACHE_OPTS)
         ds = HDF5DatasetWrapper(f, f[dpath])
     else:
         try:
-            f = h5.File(fpath, mode)
+            f = h5.File(fpath, mode, **HDF5_CACHE_OPTS)
             d = f.create_dataset(dpath, shape=shape, dtype=dtype, fillvalue=fill)
             ds = HDF5DatasetWrapper(f, d)
         except OSError:
@@ -1,3 +1,4 @@
+import numba
 import numpy as np
 import pandas as pd
 
@@ -7,6 +8,7 @@ import pandas as pd
 #
 
 
+@numba.jit(nopython=True)
 def centroid_3d(arr):
     length = arr.shape[0]
 
@@ -17,6 +19,7 @@ def centroid_3d(arr):
     return sum_x / length, sum_y / length, sum_z / length
 
 
+@numba.jit(nopython=True)
 def rescale_3d(X, x_scale, y_scale, z_scale):
     X_rescaled = np.zeros_like(X)
     X_rescaled[:, 0] = X[:, 0] * x_scale
@@ -1,543 +1,737 @@
-import copy
-import os
-import time
-from collections import defaultdict
-from typing import Callable
-from datetime import datetime
-import numpy as np
-from loguru import logger
-from tqdm import tqdm, trange
-
-from medicaltorch import losses as mt_losses
-from medicaltorch import metrics as mt_metrics
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-from torch import Tensor
-
-
-from survos2.frontend.nb_utils import show_images
-
-device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-
-
-def save_model(model, optimizer, filename, torch_models_fullpath):
-    if not os.path.exists(torch_models_fullpath):
-        os.makedirs(torch_models_fullpath)
-
-    def save_model(model_dictionary):
-        checkpoint_directory = torch_models_fullpath
-        file_path = os.path.join(checkpoint_directory, filename)
-        torch.save(model_dictionary, file_path)
-
-    model_dictionary = {
-        "model_state": model.state_dict(),
-        "model_optimizer": optimizer.state_dict(),
-    }
-    save_model(model_dictionary)
-
-
-def display_pred(inputs, label_batch, pred, patch_size=(1, 224, 224)):
-    # input_images_rgb = [
-    #    x.transpose((1, 2, 0)).reshape(patch_size) for x in inputs.cpu().numpy()
-    # ]
-    input_images_rgb = inputs.cpu().numpy()
-    target_masks_rgb = [((x > 0) * 1.0)[0, :].T for x in label_batch.cpu().numpy()]
-    pred_rgb = [pred[x, 0:1, :].cpu().detach().numpy() for x in range(pred.shape[0])]
-    pred_rgb = [x / np.max(x) for x in pred_rgb]
-    pred_rgb = [x.reshape(patch_size[1:3]) for x in pred_rgb]
-
-    [
-        show_images([input_images_rgb[i], target_masks_rgb[i], pred_rgb[i]])
-        for i in range(pred.shape[0])
-    ]
-    return input_images_rgb, pred_rgb, target_masks_rgb
-
-
-def dataset_from_numpy(*ndarrays, device=None, dtype=torch.float32):
-    tensors = map(torch.from_numpy, ndarrays)
-    return TensorDataset(*[t.to(device, dtype) for t in tensors])
-
-
-def score_dice(pred, targ, dim=1, smoothing=1.0, eps=1e-7) -> Tensor:
-    pred = torch.FloatTensor(pred)
-    targ = torch.FloatTensor(targ)
-    pred, targ = pred.contiguous(), targ.contiguous()
-    intersection = (pred * targ).sum(dim=dim).sum(dim=dim)
-    cardinality = pred.sum(dim=dim).sum(dim=dim) + targ.sum(dim=dim).sum(dim=dim) + smoothing
-    loss = (2.0 * intersection + smoothing) / cardinality
-
-    return loss.mean()
-
-
-def loss_dice(pred: Tensor, targ: Tensor, dim=2, smooth=1.0, eps=1e-7) -> Tensor:
-    # pred, targ = pred.contiguous(), targ.contiguous()
-    intersection = (pred * targ).sum(dim=dim).sum(dim=dim)
-    cardinality = pred.sum(dim=dim).sum(dim=dim) + targ.sum(dim=dim).sum(dim=dim) + smooth
-
-    loss = (2.0 * intersection + smooth) / cardinality
-    loss = 1.0 - loss
-
-    return loss.mean()
-
-
-def dice_loss(pred, target, smooth=1.0):
-    pred = pred.contiguous()
-    target = target.contiguous()
-    intersection = (pred * target).sum(dim=2).sum(dim=2)
-
-    loss = 1 - (
-        (2.0 * intersection + smooth)
-        / (pred.sum(dim=2).sum(dim=2) + target.sum(dim=2).sum(dim=2) + smooth)
-    )
-
-    return loss.mean()
-
-
-def calc_loss(pred, target, metrics, bce_weight=0.5):
-    bce = F.binary_cross_entropy_with_logits(pred, target)
-    pred = F.sigmoid(pred)
-    dice = dice_loss(pred, target)
-    loss = bce * bce_weight + dice * (1 - bce_weight)
-
-    return loss
-
-
-def predict(test_loader, model, device):
-    inputs, label_batch = next(iter(test_loader))
-    inputs = inputs.to(device)
-    label_batch = label_batch.to(device)
-    print(inputs.shape, label_batch.shape)
-    pred = model(inputs)
-    pred = F.sigmoid(pred)
-    # pred = F.softmax(pred)
-    pred_np = pred.data.cpu().numpy()
-    print(pred_np.shape)
-
-    return pred
-
-
-def fpn3d_loss(preds, label_batch, bce_weight):
-    preds = F.sigmoid(preds)
-    bce = F.binary_cross_entropy_with_logits(preds, label_batch)
-    dice = dice_loss(preds, label_batch)
-    # loss = bce * (1 - dice_weight) + dice * dice_weight
-    loss = bce * bce_weight + dice * (1 - bce_weight)
-
-    return loss
-
-
-def unet3d_loss2(preds, label_batch, bce_weight):
-    # smax = F.softmax(preds, dim=1)
-    pred = F.sigmoid(preds)  # , dim=1)
-    bce = F.binary_cross_entropy_with_logits(pred, label_batch)
-    dice = dice_loss(pred, label_batch)
-    loss = bce * bce_weight + dice * (1 - bce_weight)
-
-    return loss
-
-
-def unet3d_loss(preds, label_batch, bce_weight):
-    # smax = F.softmax(preds, dim=1)
-    pred = F.sigmoid(preds)  # , dim=1)
-    bce = F.binary_cross_entropy_with_logits(pred, label_batch)
-    dice = mt_losses.dice_loss(pred, label_batch)
-    loss = bce * bce_weight + dice * (1 - bce_weight)
-
-    return loss
-
-
-def prepare_labels_fpn3d(label_batch, input_batch):
-    label_batch = label_batch.to(device).unsqueeze(1).float()
-    return label_batch
-
-
-def prepare_labels_unet3d(labels, input_batch):
-    label_batch = torch.zeros(
-        (
-            input_batch.shape[0],
-            2,
-            input_batch.shape[-3],
-            input_batch.shape[-2],
-            input_batch.shape[-1],
-        )
-    )
-
-    label_batch[:, 0, :] = labels.float()
-    label_batch[:, 1, :] = labels.float()
-    return label_batch
-
-
-class TrainerCallback:
-    def __init__(self):
-        self.debug_verbose = False
-
-    def on_train_begin(self):
-        if self.debug_verbose:
-            logger.debug("On train begin")
-
-    def on_train_end(self):
-        if self.debug_verbose:
-            logger.debug("On train end")
-
-    def on_val_begin(self):
-        if self.debug_verbose:
-            logger.debug("On validation begin")
-
-    def on_val_loss(self):
-        if self.debug_verbose:
-            logger.debug("On validation loss")
-
-    def on_val_end(self):
-        if self.debug_verbose:
-            logger.debug("On validation end")
-
-    def on_epoch_begin(self):
-        if self.debug_verbose:
-            logger.debug("On epoch begin")
-
-    def on_epoch_end(self):
-        if self.debug_verbose:
-            logger.debug("On epoch end")
-
-    def on_batch_begin(self):
-        if self.debug_verbose:
-            logger.debug("On batch begin")
-
-    def on_batch_end(self):
-        if self.debug_verbose:
-            logger.debug("On batch end")
-
-    def on_loss_begin(self):
-        if self.debug_verbose:
-            logger.debug("On loss begin")
-
-    def on_loss_end(self):
-        if self.debug_verbose:
-            logger.debug("On loss end")
-
-    def on_step_begin(self):
-        if self.debug_verbose:
-            logger.debug("On step begin")
-
-    def on_step_end(self):
-        if self.debug_verbose:
-            logger.debug("On step end")
-
-
-class Trainer:
-    def __init__(
-        self,
-        model: torch.nn.Module,
-        optimizer: torch.optim.Optimizer,
-        criterion,
-        lr_scheduler: torch.optim.lr_scheduler,
-        dataloaders: dict,
-        callback: TrainerCallback,
-        prepare_labels: Callable,
-        num_out_channels: int,
-        num_epochs: int,
-        initial_lr: float,
-        device: int,
-        accumulate_iters: int = 8,
-        model_output_as_list=False,
-    ):
-        self.model = model
-        self.criterion = criterion
-        self.optimizer = optimizer
-        self.lr_scheduler = lr_scheduler
-        self.dataloaders = dataloaders
-        self.num_epochs = num_epochs
-        self.initial_lr = initial_lr
-        self.device = device
-        self.callback = callback
-        self._epoch = 0
-        self.prepare_labels = prepare_labels
-        self.num_out_channels = num_out_channels
-        self.accumulate_iters = accumulate_iters
-        self.model_output_as_list = model_output_as_list
-
-        self.training_loss = []
-        self.validation_loss = []
-        self.learning_rate = []
-
-    def run(self):
-        progressbar = trange(self.num_epochs, desc="Progress")
-        best_model_weights = copy.deepcopy(self.model.state_dict())
-        best_loss = 1e10
-
-        for i in progressbar:
-            _ = self.callback.on_epoch_begin()
-            self._epoch += 1
-            self._train()
-
-            if "val" in self.dataloaders:
-                self._validate()
-
-                # print(self.callback.validation_loss)
-                if self.callback.validation_loss[-1] < best_loss:
-                    best_loss = self.callback.validation_loss[-1]
-                    best_model_weights = copy.deepcopy(self.model.state_dict())
-
-            if self.lr_scheduler is not None:
-                self.lr_scheduler.step()
-            _ = self.callback.on_epoch_end()
-
-        self.model.load_state_dict(best_model_weights)
-        return (
-            self.callback.training_loss,
-            self.callback.validation_loss,
-            self.learning_rate,
-        )
-
-    def _train(self):
-        ###
-
-        _ = self.callback.on_train_begin()
-
-        self.lr_scheduler.step()
-        lr = self.lr_scheduler.get_lr()[0]
-        self.model.train()
-
-        # if torch.cuda.device_count() > 1:
-        #     print("Using", torch.cuda.device_count(), "GPUs")
-        #     self.model = nn.DataParallel(self.model)
-
-        num_steps = 0
-
-        batch_iter = tqdm(
-            enumerate(self.dataloaders["train"]),
-            "Training",
-            total=len(self.dataloaders["train"]),
-            leave=False,
-        )
-
-        for i, (input_batch, label_batch) in batch_iter:
-            input_batch = input_batch.float().to(self.device).unsqueeze(1)
-            label_batch = self.prepare_labels(label_batch, input_batch)
-            # print(input_batch.shape, label_batch.shape)
-            label_batch = label_batch.to(self.device)
-            if self.model_output_as_list:
-                preds = self.model(input_batch)[0]
-            else:
-                preds = self.model(input_batch)
-            # print(preds[0].shape)
-            preds_post = preds[:, 0 : self.num_out_channels, :, :, :]
-            loss = self.criterion(preds_post, label_batch)
-            loss_value = loss.item()
-            ###
-            _ = self.callback.on_loss_end(loss_value)
-            loss.backward()
-            if ((i + 1) % self.accumulate_iters == 0) or (i + 1 == len(self.dataloaders["train"])):
-                self.optimizer.step()
-                self.optimizer.zero_grad()
-
-            num_steps += 1
-            batch_iter.set_description(f"Training: (loss {loss_value:.4f})")
-
-        self.learning_rate.append(self.optimizer.param_groups[0]["lr"])
-        batch_iter.close()
-        self.training_loss = self.callback.on_train_end()
-
-    def _validate(self):
-        self.model.eval()
-        batch_iter = tqdm(
-            enumerate(self.dataloaders["val"]),
-            "Validation",
-            total=len(self.dataloaders["val"]),
-            leave=False,
-        )
-
-        for i, (input_batch, label_batch) in batch_iter:
-            with torch.no_grad():
-                input_batch = input_batch.float().unsqueeze(1)
-                label_batch = self.prepare_labels(label_batch, input_batch)
-                input_batch, label_batch = (
-                    input_batch.to(self.device),
-                    label_batch.to(self.device),
-                )
-
-                if self.model_output_as_list:
-                    preds = self.model(input_batch)[0]
-                else:
-                    preds = self.model(input_batch)
-
-                preds_post = preds[:, 0 : self.num_out_channels, :, :, :]
-
-                loss = self.criterion(preds_post, label_batch)
-                loss_value = loss.item()
-                # print(loss_value)
-                ###
-                _ = self.callback.on_val_loss(loss_value)
-                batch_iter.set_description(f"Validation: (loss {loss_value:.4f})")
-        _ = self.callback.on_val_end()
-
-        batch_iter.close()
-
-
-class MetricCallback(TrainerCallback):
-    def __init__(self):
-        super(MetricCallback, self).__init__()
-        self.training_loss = []
-        self.validation_loss = []
-
-    def on_train_begin(self):
-        # self.training_loss = []
-        pass
-
-    def on_loss_end(self, loss):
-        self.training_loss.append(loss)
-
-    def on_train_end(self):
-        print(f"Avg training loss: {np.mean(self.training_loss)}")
-        return self.training_loss
-
-    def on_val_loss(self, loss):
-        self.validation_loss.append(loss)
-
-    def on_val_end(self):
-        print(f"Avg validation loss: {np.mean(self.validation_loss)}")
-        return self.validation_loss
-
-
-class Metric:
-    def __init__(self):
-        pass
-
-    def __call__(self, outputs, target, loss):
-        raise NotImplementedError
-
-    def reset(self):
-        raise NotImplementedError
-
-    def value(self):
-        raise NotImplementedError
-
-    def name(self):
-        raise NotImplementedError
-
-
-class AverageValueMetric(Metric):
-    def __init__(self):
-        self.values = []
-
-    def __call__(self, value):
-        self.values.append(value)
-        return self.value()
-
-    def reset(self):
-        self.values = []
-
-    def value(self):
-        return np.mean(self.values)
-
-    def name(self):
-        return "Average"
-
-
-default_criterion = {
-    "cross_entropy": lambda model, X, y: F.cross_entropy(model(X), y, reduction="mean"),
-    "mse": lambda model, X, y: 0.5 * F.mse_loss(model(X), y, reduction="mean"),
-}
-
-
-#########################################
-def log_metrics(metrics: dict, epoch_samples: int, phase: str):
-    outputs = []
-
-    for k in metrics.keys():
-        outputs.append("{}: {:4f}".format(k, metrics[k] / epoch_samples))
-
-    print("Metrics -  {} {}".format(phase, ", ".join(outputs)))
-
-    # for metric in metrics:
-    #    message += "\t{}: {}".format(metric.name(), metric.value())
-
-
-def loss_calc(pred: Tensor, target: Tensor, metrics: dict, dice_weight=0.5) -> float:
-    bce = F.binary_cross_entropy_with_logits(pred, target)
-    pred = F.sigmoid(pred)
-    dice = loss_dice(pred, target)
-    loss = bce * (1 - dice_weight) + dice * (dice_weight)
-
-    metrics["bce"] += bce.data.cpu().numpy() * target.size(0)
-    metrics["dice"] += dice.data.cpu().numpy() * target.size(0)
-    metrics["loss"] += loss.data.cpu().numpy() * target.size(0)
-
-    return loss
-
-
-def train_detector_head(
-    model3d,
-    optimizer,
-    dataloaders,
-    checkpoint_directory,
-    num_epochs=5,
-    device=0,
-    batch_size=1,
-    defrost_after=None,
-    num_samples_per_log_entry=200,
-):
-    from survos2.entity.models.head_cnn import make_classifications
-
-    epochs, losses = [], []
-    iters_sub, train_acc, val_acc = [], [], []
-    criterion = nn.CrossEntropyLoss(
-        # weight=torch.FloatTensor([1.0, 1.0, 1.0, 1.0, 1.0, 0.2, 0.5]).to(0)
-    )
-    weight_decay = 1e-4
-    n = 0
-
-    for epoch in range(num_epochs):
-        epoch_losses = []
-        print(f"Epoch: {epoch}")
-        best_validation_accuracy = 0
-
-        if defrost_after is not None:
-            if epochs > defrost_after:
-                for param in model3d.parameters():
-                    param.requires_grad = True
-
-        for img, label in dataloaders["train"]:
-            optimizer.zero_grad()
-            var_input = img[0].float().to(device).unsqueeze(1)
-            out = model3d.forward_pyr(var_input)
-            # plt.figure()
-            # plt.imshow(out[0][0,0,16,:].cpu().detach().numpy())
-            _, class_logits = model3d.Classifier(out[0])
-
-            target_label = torch.Tensor([label["labels"]]).long().to(device)
-            loss = criterion(
-                class_logits,
-                target_label,
-            )
-
-            loss.backward()
-            optimizer.step()
-            epoch_losses.append(loss.detach().cpu().numpy() / batch_size)
-
-            if n % num_samples_per_log_entry == 0:
-                iters_sub.append(n)
-                train_acc.append(make_classifications(model3d, dataloaders["train"], device)[1])
-                val_acc.append(make_classifications(model3d, dataloaders["val"], device)[1])
-
-            n += 1
-            if val_acc[-1] > best_validation_accuracy:
-                print(f"Better validation accuracy: {val_acc[-1]}")
-                best_validation_accuracy = val_acc[-1]
-
-                now = datetime.now()
-                dt_string = now.strftime("%d%m_%H%M")
-
-                checkpoint_fname = "detector_" + dt_string + ".pt"
-                save_model(model3d, optimizer, checkpoint_fname, checkpoint_directory)
-                print(f"Wrote checkpoint: {checkpoint_fname}")
-        print(train_acc)
-        epochs.append(epoch)
-        losses.append(np.mean(epoch_losses))
-
-    accuracies = {}
-    accuracies["train"] = train_acc
-    accuracies["val"] = val_acc
-
-    return epochs, losses, accuracies
+import copy
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from datetime import datetime
+import numpy as np
+from loguru import logger
+from tqdm import tqdm, trange
+
+from medicaltorch import losses as mt_losses
+from medicaltorch import metrics as mt_metrics
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+
+
+from survos2.frontend.nb_utils import show_images
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def save_model(model, optimizer, filename, torch_models_fullpath, _cache=set()):
+    # The directory check is memoized per process; os.makedirs with
+    # exist_ok avoids the exists/makedirs race the old code had.
+    if torch_models_fullpath not in _cache:
+        os.makedirs(torch_models_fullpath, exist_ok=True)
+        _cache.add(torch_models_fullpath)
+    torch.save(
+        {
+            "model_state": model.state_dict(),
+            "model_optimizer": optimizer.state_dict(),
+        },
+        os.path.join(torch_models_fullpath, filename),
+    )
+
+
+def display_pred(inputs, label_batch, pred, patch_size=(1, 224, 224)):
+    # Normalize on-device and batch the device-to-host copies into one
+    # transfer per tensor rather than one .cpu() sync per sample.
+    pred = pred.detach()
+    pred_max = pred[:, 0:1].amax(dim=(2, 3), keepdim=True).clamp_min(1e-7)
+    pred_norm = (pred[:, 0:1] / pred_max).reshape(-1, *patch_size[1:3])
+    target_masks = (label_batch > 0).float()[:, 0].transpose(-1, -2)
+
+    input_images_rgb = inputs.cpu().numpy()
+    target_masks_rgb = list(target_masks.cpu().numpy())
+    pred_rgb = list(pred_norm.cpu().numpy())
+
+    for i in range(pred.shape[0]):
+        show_images([input_images_rgb[i], target_masks_rgb[i], pred_rgb[i]])
+    return input_images_rgb, pred_rgb, target_masks_rgb
+
+
+def dataset_from_numpy(*ndarrays, device=None, dtype=torch.float32):
+    tensors = map(torch.from_numpy, ndarrays)
+    return TensorDataset(*[t.to(device, dtype) for t in tensors])
+
+
+@torch.jit.script
+def dice_loss(pred: Tensor, target: Tensor, smooth: float = 1.0) -> Tensor:
+    # Single fused reduction over all spatial dims; scripting lets the
+    # fuser merge the elementwise product and the three sums into one
+    # pass instead of materializing intermediate 5D tensors.
+    dims = list(range(2, pred.dim()))
+    intersection = (pred * target).sum(dims)
+    cardinality = pred.sum(dims) + target.sum(dims) + smooth
+    return (1.0 - (2.0 * intersection + smooth) / cardinality).mean()
+
+
+def score_dice(pred, targ, smoothing=1.0, eps=1e-7) -> Tensor:
+    # as_tensor keeps the input's device and aliases tensors instead of
+    # forcing a CPU copy like torch.FloatTensor did.
+    pred = torch.as_tensor(pred, dtype=torch.float32)
+    targ = torch.as_tensor(targ, dtype=torch.float32)
+    return 1.0 - dice_loss(pred, targ, smoothing)
+
+
+def loss_dice(pred: Tensor, targ: Tensor, smooth=1.0, eps=1e-7) -> Tensor:
+    return dice_loss(pred, targ, smooth)
+
+
+@torch.jit.script
+def combo_loss(logits: Tensor, target: Tensor, bce_weight: float = 0.5) -> Tensor:
+    """Weighted BCE + dice computed from the logits in a single scripted
+    pass: BCE stays on the numerically-stable logits path and the dice
+    term reuses one sigmoid, so the prediction tensor is traversed once
+    instead of three times."""
+    bce = F.binary_cross_entropy_with_logits(logits, target)
+    probs = torch.sigmoid(logits)
+    dims = list(range(2, logits.dim()))
+    intersection = (probs * target).sum(dims)
+    cardinality = probs.sum(dims) + target.sum(dims) + 1.0
+    dice = (1.0 - (2.0 * intersection + 1.0) / cardinality).mean()
+    return bce * bce_weight + dice * (1.0 - bce_weight)
+
+
+def calc_loss(pred, target, metrics, bce_weight=0.5):
+    return combo_loss(pred, target, bce_weight)
+
+
+def predict(test_loader, model, device):
+    inputs, label_batch = next(iter(test_loader))
+    inputs = inputs.to(device, non_blocking=True)
+    label_batch = label_batch.to(device, non_blocking=True)
+    print(inputs.shape, label_batch.shape)
+    pred = model(inputs)
+    pred = F.sigmoid(pred)
+    # pred = F.softmax(pred)
+    pred_np = pred.data.cpu().numpy()
+    print(pred_np.shape)
+
+    return pred
+
+
+def fpn3d_loss(preds, label_batch, bce_weight):
+    return combo_loss(preds, label_batch, bce_weight)
+
+
+def unet3d_loss2(preds, label_batch, bce_weight):
+    return combo_loss(preds, label_batch, bce_weight)
+
+
+def unet3d_loss(preds, label_batch, bce_weight):
+    # smax = F.softmax(preds, dim=1)
+    pred = F.sigmoid(preds)  # , dim=1)
+    bce = F.binary_cross_entropy_with_logits(pred, label_batch)
+    dice = mt_losses.dice_loss(pred, label_batch)
+    loss = bce * bce_weight + dice * (1 - bce_weight)
+
+    return loss
+
+
+def prepare_labels_fpn3d(label_batch, input_batch):
+    label_batch = label_batch.to(input_batch.device, non_blocking=True).unsqueeze(1).float()
+    return label_batch
+
+
+_unet3d_label_buf = None
+
+
+def prepare_labels_unet3d(labels, input_batch):
+    # Duplicate the label volume across both output channels directly on
+    # the input's device, reusing one persistent buffer across batches so
+    # each step avoids a fresh multi-MB allocation.
+    global _unet3d_label_buf
+    shape = (input_batch.shape[0], 2) + tuple(input_batch.shape[-3:])
+    buf = _unet3d_label_buf
+    if buf is None or tuple(buf.shape) != shape or buf.device != input_batch.device:
+        buf = torch.empty(shape, dtype=torch.float32, device=input_batch.device)
+        _unet3d_label_buf = buf
+    lab = labels.to(input_batch.device, non_blocking=True).float()
+    buf[:, 0].copy_(lab, non_blocking=True)
+    buf[:, 1].copy_(lab, non_blocking=True)
+    return buf
+
+
+class DataPrefetcher:
+    """Iterates a DataLoader one batch ahead, issuing the host-to-device copy
+    of the input volume on a side CUDA stream so it overlaps with compute on
+    the current stream. Falls back to synchronous copies without CUDA.
+    Labels are handed back untouched so prepare_labels keeps working on them.
+    """
+
+    def __init__(self, loader, device):
+        self.loader = iter(loader)
+        self.device = device
+        self.use_stream = torch.cuda.is_available()
+        self.stream = torch.cuda.Stream() if self.use_stream else None
+        self.next_input = None
+        self.next_label = None
+        self.preload()
+
+    def preload(self):
+        try:
+            input_batch, label_batch = next(self.loader)
+        except StopIteration:
+            self.next_input = None
+            self.next_label = None
+            return
+        if self.use_stream:
+            with torch.cuda.stream(self.stream):
+                self.next_input = (
+                    input_batch.to(self.device, non_blocking=True).float().unsqueeze(1)
+                )
+        else:
+            self.next_input = input_batch.float().to(self.device).unsqueeze(1)
+        self.next_label = label_batch
+
+    def next(self):
+        if self.next_input is None:
+            return None, None
+        if self.use_stream:
+            torch.cuda.current_stream().wait_stream(self.stream)
+            self.next_input.record_stream(torch.cuda.current_stream())
+        input_batch, label_batch = self.next_input, self.next_label
+        self.preload()
+        return input_batch, label_batch
+
+
+class TrainerCallback:
+    def __init__(self):
+        self.debug_verbose = False
+
+    def on_train_begin(self):
+        if self.debug_verbose:
+            logger.debug("On train begin")
+
+    def on_train_end(self):
+        if self.debug_verbose:
+            logger.debug("On train end")
+
+    def on_val_begin(self):
+        if self.debug_verbose:
+            logger.debug("On validation begin")
+
+    def on_val_loss(self):
+        if self.debug_verbose:
+            logger.debug("On validation loss")
+
+    def on_val_end(self):
+        if self.debug_verbose:
+            logger.debug("On validation end")
+
+    def on_epoch_begin(self):
+        if self.debug_verbose:
+            logger.debug("On epoch begin")
+
+    def on_epoch_end(self):
+        if self.debug_verbose:
+            logger.debug("On epoch end")
+
+    def on_batch_begin(self):
+        if self.debug_verbose:
+            logger.debug("On batch begin")
+
+    def on_batch_end(self):
+        if self.debug_verbose:
+            logger.debug("On batch end")
+
+    def on_loss_begin(self):
+        if self.debug_verbose:
+            logger.debug("On loss begin")
+
+    def on_loss_end(self):
+        if self.debug_verbose:
+            logger.debug("On loss end")
+
+    def on_step_begin(self):
+        if self.debug_verbose:
+            logger.debug("On step begin")
+
+    def on_step_end(self):
+        if self.debug_verbose:
+            logger.debug("On step end")
+
+
+class Trainer:
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        optimizer: torch.optim.Optimizer,
+        criterion,
+        lr_scheduler: torch.optim.lr_scheduler,
+        dataloaders: dict,
+        callback: TrainerCallback,
+        prepare_labels: Callable,
+        num_out_channels: int,
+        num_epochs: int,
+        initial_lr: float,
+        device: int,
+        accumulate_iters: int = 8,
+        model_output_as_list=False,
+        ddp: bool = False,
+        local_rank: int = 0,
+    ):
+        if torch.cuda.is_available():
+            # Patch shapes are fixed across an epoch, so let cuDNN autotune
+            # its conv algorithm on the first batch and reuse it, and allow
+            # TF32 tensor-core paths for fp32 matmuls/convs.
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        # channels_last_3d (NDHWC) lets cuDNN select its tensor-core 3D
+        # conv kernels; relabelling the weight strides is cheap and is done
+        # before any DDP wrap so the gradient buckets share the layout.
+        self.channels_last = torch.cuda.is_available()
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last_3d)
+        self.model = model
+        self.ddp = ddp
+        self.local_rank = local_rank
+        if ddp:
+            # Single-node multi-GPU via NCCL AllReduce; strictly faster
+            # than the thread-based nn.DataParallel scatter/gather.
+            import torch.distributed as dist
+            from torch.nn.parallel import DistributedDataParallel as DDP
+
+            if not dist.is_initialized():
+                dist.init_process_group("nccl")
+            torch.cuda.set_device(local_rank)
+            device = local_rank
+            self.model = DDP(
+                model.to(local_rank),
+                device_ids=[local_rank],
+                find_unused_parameters=False,
+                gradient_as_bucket_view=True,
+            )
+        self.criterion = criterion
+        if hasattr(torch, "compile") and torch.cuda.is_available():
+            # Inductor fuses the conv stacks and the sigmoid/BCE/dice loss
+            # tail and cuts per-kernel launch overhead; shapes are static
+            # here so dynamic tracing is off. Falls back to eager on
+            # platforms where the compiler is unavailable.
+            try:
+                self.model = torch.compile(
+                    self.model, mode="max-autotune", fullgraph=False, dynamic=False
+                )
+                self.criterion = torch.compile(criterion)
+            except Exception:
+                logger.debug("torch.compile unavailable; running eager")
+        self.optimizer = optimizer
+        self.lr_scheduler = lr_scheduler
+        # CUDA can only DMA from page-locked memory, so rebuild any loader
+        # that was constructed without pin_memory; the non_blocking copies
+        # in the prefetcher are synchronous otherwise.
+        if torch.cuda.is_available():
+            for phase, loader in list(dataloaders.items()):
+                if isinstance(loader, torch.utils.data.DataLoader) and not loader.pin_memory:
+                    dataloaders[phase] = torch.utils.data.DataLoader(
+                        loader.dataset,
+                        batch_size=loader.batch_size,
+                        sampler=loader.sampler,
+                        num_workers=loader.num_workers,
+                        collate_fn=loader.collate_fn,
+                        drop_last=loader.drop_last,
+                        pin_memory=True,
+                    )
+        self.dataloaders = dataloaders
+        self.num_epochs = num_epochs
+        self.initial_lr = initial_lr
+        self.device = device
+        self.callback = callback
+        self._epoch = 0
+        self.prepare_labels = prepare_labels
+        self.num_out_channels = num_out_channels
+        self.accumulate_iters = accumulate_iters
+        self.model_output_as_list = model_output_as_list
+        # Mixed precision: fp16 forward/backward on tensor cores, with loss
+        # scaling to keep small gradients from underflowing. Disabled
+        # automatically on CPU.
+        self.scaler = torch.cuda.amp.GradScaler(enabled=torch.cuda.is_available())
+        # How often (in batches) the loss is synced to the host for the
+        # callback and the progress bar.
+        self.log_interval = 10
+
+        self.training_loss = []
+        self.validation_loss = []
+        self.learning_rate = []
+
+    @staticmethod
+    def build_optimizer(params, kind="adamw", lr=1e-3, **kwargs):
+        """Construct an optimizer whose step batches the per-parameter
+        update into a few large kernels (fused on CUDA, foreach
+        otherwise) instead of a Python loop over every tensor — worth it
+        for 3D U-Net/FPN models with hundreds of parameter tensors. The
+        trainer already pairs this with zero_grad(set_to_none=True).
+        Falls back to the stock implementation on older torch builds.
+        """
+        opts = {"adamw": torch.optim.AdamW, "adam": torch.optim.Adam, "sgd": torch.optim.SGD}
+        opt_cls = opts[kind.lower()]
+        if torch.cuda.is_available():
+            try:
+                return opt_cls(params, lr=lr, fused=True, **kwargs)
+            except (TypeError, RuntimeError):
+                pass
+        try:
+            return opt_cls(params, lr=lr, foreach=True, **kwargs)
+        except TypeError:
+            return opt_cls(params, lr=lr, **kwargs)
+
+    def _snapshot_state(self):
+        # Clone the weights to host memory; deepcopy would pickle live GPU
+        # tensors and briefly double VRAM for large 3D models.
+        return {k: v.detach().cpu().clone() for k, v in self.model.state_dict().items()}
+
+    def run(self):
+        progressbar = trange(self.num_epochs, desc="Progress")
+        best_model_weights = self._snapshot_state()
+        best_loss = 1e10
+
+        for i in progressbar:
+            _ = self.callback.on_epoch_begin()
+            self._epoch += 1
+            if self.ddp:
+                sampler = getattr(self.dataloaders["train"], "sampler", None)
+                if hasattr(sampler, "set_epoch"):
+                    sampler.set_epoch(self._epoch)
+            self._train()
+
+            if "val" in self.dataloaders:
+                self._validate()
+
+                # print(self.callback.validation_loss)
+                if self.callback.validation_loss[-1] < best_loss:
+                    best_loss = self.callback.validation_loss[-1]
+                    best_model_weights = self._snapshot_state()
+
+            if self.lr_scheduler is not None:
+                self.lr_scheduler.step()
+            _ = self.callback.on_epoch_end()
+
+        self.model.load_state_dict({k: v.to(self.device) for k, v in best_model_weights.items()})
+        return (
+            self.callback.training_loss,
+            self.callback.validation_loss,
+            self.learning_rate,
+        )
+
+    def _train(self):
+        ###
+
+        _ = self.callback.on_train_begin()
+
+        self.lr_scheduler.step()
+        lr = self.lr_scheduler.get_lr()[0]
+        self.model.train()
+
+        # if torch.cuda.device_count() > 1:
+        #     print("Using", torch.cuda.device_count(), "GPUs")
+        #     self.model = nn.DataParallel(self.model)
+
+        num_steps = 0
+
+        batch_iter = tqdm(
+            range(len(self.dataloaders["train"])),
+            "Training",
+            total=len(self.dataloaders["train"]),
+            leave=False,
+        )
+        prefetcher = DataPrefetcher(self.dataloaders["train"], self.device)
+        loss_accum = None
+
+        for i in batch_iter:
+            input_batch, label_batch = prefetcher.next()
+            if input_batch is None:
+                break
+            label_batch = self.prepare_labels(label_batch, input_batch)
+            # print(input_batch.shape, label_batch.shape)
+            label_batch = label_batch.to(self.device, non_blocking=True)
+            if self.channels_last and input_batch.dim() == 5:
+                input_batch = input_batch.contiguous(memory_format=torch.channels_last_3d)
+                label_batch = label_batch.contiguous(memory_format=torch.channels_last_3d)
+            with torch.cuda.amp.autocast(enabled=self.scaler.is_enabled()):
+                if self.model_output_as_list:
+                    preds = self.model(input_batch)[0]
+                else:
+                    preds = self.model(input_batch)
+                # print(preds[0].shape)
+                preds_post = preds[:, 0 : self.num_out_channels, :, :, :]
+                loss = self.criterion(preds_post, label_batch)
+            # Accumulate the loss on device; .item() forces a stream sync,
+            # so only pay for it at the logging interval.
+            loss_detached = loss.detach()
+            loss_accum = loss_detached if loss_accum is None else loss_accum + loss_detached
+            is_step = ((i + 1) % self.accumulate_iters == 0) or (
+                i + 1 == len(self.dataloaders["train"])
+            )
+            if self.ddp and not is_step:
+                # Skip the AllReduce on the accumulation microbatches; the
+                # gradients are synchronized once at the step boundary.
+                with self.model.no_sync():
+                    self.scaler.scale(loss).backward()
+            else:
+                self.scaler.scale(loss).backward()
+            if is_step:
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+                self.optimizer.zero_grad(set_to_none=True)
+
+            num_steps += 1
+            if (i + 1) % self.log_interval == 0 or i + 1 == len(self.dataloaders["train"]):
+                loss_value = loss_detached.item()
+                _ = self.callback.on_loss_end(loss_value)
+                batch_iter.set_description(f"Training: (loss {loss_value:.4f})")
+
+        self.learning_rate.append(self.optimizer.param_groups[0]["lr"])
+        batch_iter.close()
+        self.training_loss = self.callback.on_train_end()
+
+    def _validate(self):
+        self.model.eval()
+        batch_iter = tqdm(
+            range(len(self.dataloaders["val"])),
+            "Validation",
+            total=len(self.dataloaders["val"]),
+            leave=False,
+        )
+        prefetcher = DataPrefetcher(self.dataloaders["val"], self.device)
+
+        for i in batch_iter:
+            with torch.no_grad():
+                input_batch, label_batch = prefetcher.next()
+                if input_batch is None:
+                    break
+                label_batch = self.prepare_labels(label_batch, input_batch)
+                label_batch = label_batch.to(self.device, non_blocking=True)
+                if self.channels_last and input_batch.dim() == 5:
+                    input_batch = input_batch.contiguous(memory_format=torch.channels_last_3d)
+                    label_batch = label_batch.contiguous(memory_format=torch.channels_last_3d)
+
+                with torch.cuda.amp.autocast(enabled=self.scaler.is_enabled()):
+                    if self.model_output_as_list:
+                        preds = self.model(input_batch)[0]
+                    else:
+                        preds = self.model(input_batch)
+
+                    preds_post = preds[:, 0 : self.num_out_channels, :, :, :]
+
+                    loss = self.criterion(preds_post, label_batch)
+                loss_detached = loss.detach()
+                if (i + 1) % self.log_interval == 0 or i + 1 == len(self.dataloaders["val"]):
+                    loss_value = loss_detached.item()
+                    _ = self.callback.on_val_loss(loss_value)
+                    batch_iter.set_description(f"Validation: (loss {loss_value:.4f})")
+        _ = self.callback.on_val_end()
+
+        batch_iter.close()
+
+
+class MetricCallback(TrainerCallback):
+    def __init__(self):
+        super(MetricCallback, self).__init__()
+        self.training_loss = []
+        self.validation_loss = []
+
+    def on_train_begin(self):
+        # self.training_loss = []
+        pass
+
+    def on_loss_end(self, loss):
+        self.training_loss.append(loss)
+
+    def on_train_end(self):
+        print(f"Avg training loss: {np.mean(self.training_loss)}")
+        return self.training_loss
+
+    def on_val_loss(self, loss):
+        self.validation_loss.append(loss)
+
+    def on_val_end(self):
+        print(f"Avg validation loss: {np.mean(self.validation_loss)}")
+        return self.validation_loss
+
+
+class Metric:
+    def __init__(self):
+        pass
+
+    def __call__(self, outputs, target, loss):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+    def name(self):
+        raise NotImplementedError
+
+
+class AverageValueMetric(Metric):
+    def __init__(self):
+        self.values = []
+
+    def __call__(self, value):
+        self.values.append(value)
+        return self.value()
+
+    def reset(self):
+        self.values = []
+
+    def value(self):
+        return np.mean(self.values)
+
+    def name(self):
+        return "Average"
+
+
+default_criterion = {
+    "cross_entropy": lambda model, X, y: F.cross_entropy(model(X), y, reduction="mean"),
+    "mse": lambda model, X, y: 0.5 * F.mse_loss(model(X), y, reduction="mean"),
+}
+
+
+#########################################
+def log_metrics(metrics: dict, epoch_samples: int, phase: str):
+    outputs = []
+
+    for k in metrics.keys():
+        outputs.append("{}: {:4f}".format(k, metrics[k] / epoch_samples))
+
+    print("Metrics -  {} {}".format(phase, ", ".join(outputs)))
+
+    # for metric in metrics:
+    #    message += "\t{}: {}".format(metric.name(), metric.value())
+
+
+def loss_calc(pred: Tensor, target: Tensor, metrics: dict, dice_weight=0.5) -> float:
+    bce = F.binary_cross_entropy_with_logits(pred, target)
+    pred = F.sigmoid(pred)
+    dice = loss_dice(pred, target)
+    loss = bce * (1 - dice_weight) + dice * (dice_weight)
+
+    metrics["bce"] += bce.data.cpu().numpy() * target.size(0)
+    metrics["dice"] += dice.data.cpu().numpy() * target.size(0)
+    metrics["loss"] += loss.data.cpu().numpy() * target.size(0)
+
+    return loss
+
+
+def detector_collate(batch):
+    """Stack detector-head samples into a real batch: the first filtered
+    volume of each sample plus a long tensor of class labels."""
+    imgs = torch.stack([torch.as_tensor(s[0][0], dtype=torch.float32) for s in batch])
+    targets = torch.stack([torch.as_tensor(s[1]["labels"]).reshape(-1)[0].long() for s in batch])
+    return imgs, targets
+
+
+def train_detector_head(
+    model3d,
+    optimizer,
+    dataloaders,
+    checkpoint_directory,
+    num_epochs=5,
+    device=0,
+    batch_size=8,
+    defrost_after=None,
+    num_samples_per_log_entry=200,
+):
+    from survos2.entity.models.head_cnn import make_classifications
+
+    epochs, losses = [], []
+    iters_sub, train_acc, val_acc = [], [], []
+    criterion = nn.CrossEntropyLoss(
+        # weight=torch.FloatTensor([1.0, 1.0, 1.0, 1.0, 1.0, 0.2, 0.5]).to(0)
+    )
+    weight_decay = 1e-4
+    n = 0
+
+    # The incoming loaders yield one sample at a time; restack them into
+    # real batches so the 3D forward amortizes kernel-launch overhead.
+    train_loader = dataloaders["train"]
+    if getattr(train_loader, "batch_size", 1) in (None, 1):
+        train_loader = torch.utils.data.DataLoader(
+            train_loader.dataset,
+            batch_size=batch_size,
+            shuffle=True,
+            collate_fn=detector_collate,
+            pin_memory=torch.cuda.is_available(),
+        )
+
+    best_validation_accuracy = 0
+    # Checkpoints are pickled and written by a single background worker so
+    # disk I/O doesn't stall the training loop; only the cheap CPU clone of
+    # the weights happens on this thread.
+    os.makedirs(checkpoint_directory, exist_ok=True)
+    ckpt_pool = ThreadPoolExecutor(max_workers=1)
+
+    for epoch in range(num_epochs):
+        epoch_losses = []
+        print(f"Epoch: {epoch}")
+
+        if defrost_after is not None:
+            if epoch > defrost_after:
+                for param in model3d.parameters():
+                    param.requires_grad = True
+
+        # Training accuracy comes from the logits already produced by the
+        # training forward; re-running make_classifications over the full
+        # train and val sets mid-epoch was quadratic in dataset size.
+        correct, total = 0, 0
+        for imgs, targets in train_loader:
+            optimizer.zero_grad(set_to_none=True)
+            var_input = imgs.to(device, non_blocking=True).unsqueeze(1)
+            out = model3d.forward_pyr(var_input)
+            # plt.figure()
+            # plt.imshow(out[0][0,0,16,:].cpu().detach().numpy())
+            _, class_logits = model3d.Classifier(out[0])
+
+            target_label = targets.to(device, non_blocking=True)
+            loss = criterion(
+                class_logits,
+                target_label,
+            )
+
+            loss.backward()
+            optimizer.step()
+            epoch_losses.append(loss.detach())
+            correct += (class_logits.argmax(1) == target_label).sum().item()
+            total += target_label.numel()
+            n += 1
+
+        iters_sub.append(n)
+        train_acc.append(correct / max(total, 1))
+        val_acc.append(make_classifications(model3d, dataloaders["val"], device)[1])
+
+        if val_acc and val_acc[-1] > best_validation_accuracy:
+            print(f"Better validation accuracy: {val_acc[-1]}")
+            best_validation_accuracy = val_acc[-1]
+
+            now = datetime.now()
+            dt_string = now.strftime("%d%m_%H%M")
+
+            checkpoint_fname = "detector_" + dt_string + ".pt"
+            cpu_state = {k: v.detach().cpu().clone() for k, v in model3d.state_dict().items()}
+            ckpt_pool.submit(
+                torch.save,
+                {"model_state": cpu_state, "model_optimizer": optimizer.state_dict()},
+                os.path.join(checkpoint_directory, checkpoint_fname),
+            )
+            print(f"Queued checkpoint: {checkpoint_fname}")
+        print(train_acc)
+        epochs.append(epoch)
+        losses.append(torch.stack(epoch_losses).mean().item() / batch_size)
+
+    # Make sure any in-flight checkpoint hits disk before returning.
+    ckpt_pool.shutdown(wait=True)
+
+    accuracies = {}
+    accuracies["train"] = train_acc
+    accuracies["val"] = val_acc
+
+    return epochs, losses, accuracies
@@ -1,17 +1,15 @@
 import numpy as np
 import pandas as pd
 import pyqtgraph as pg
-import seaborn as sns
 from loguru import logger
 from qtpy import QtWidgets
-from qtpy.QtCore import QSize, Signal
+from qtpy.QtCore import QAbstractTableModel, QModelIndex, QSize, Qt, Signal
 
 from survos2.entity.entities import make_entity_df, make_entity_bvol, make_entity_boxes
 from survos2.server.state import cfg
 from survos2.entity.sampler import crop_pts_bb
 
 import warnings
-from survos2.frontend.components import Table
 
 warnings.filterwarnings("ignore")
 MAX_SIZE = 10000
@@ -26,57 +24,44 @@ def setup_entity_table(
     crop_end=(MAX_SIZE, MAX_SIZE, MAX_SIZE),
     flipxy=True,
 ):
-    if entities_fullname != None:
-        print(f"Reading entity csv: {entities_fullname}")
-        entities_df = pd.read_csv(entities_fullname)
-        print(entities_df)
+    if entities_fullname is not None:
+        logger.debug(f"Reading entity csv: {entities_fullname}")
+        ## skip pandas' autosaved "Unnamed: 0" index columns at parse time
+        ## instead of allocating them and dropping them afterwards
+        entities_df = pd.read_csv(
+            entities_fullname, usecols=lambda c: not c.lower().startswith("unnamed")
+        )
+        ## lazy: head() is only rendered when debug logging is enabled
+        logger.opt(lazy=True).debug("Entity dataframe:\n{df}", df=lambda: str(entities_df.head()))
 
     # otherwise ignore filename
-    index_column = len([col for col in entities_df.columns if "index" in col]) > 0
-    print(index_column)
-    entities_df.drop(
-        entities_df.columns[entities_df.columns.str.contains("unnamed", case=False)],
-        axis=1,
-        inplace=True,
+    ## lower-case the column names once and answer both lookups from it
+    cols_lower = {col.lower(): col for col in entities_df.columns}
+    index_column = any("index" in k for k in cols_lower)
+    logger.debug(f"index_column: {index_column}")
+    ## drop only when there is something to drop; the contains-based
+    ## reindex copies every column even when no "unnamed" column exists
+    unnamed = [cols_lower[k] for k in cols_lower if "unnamed" in k]
+    if unnamed:
+        entities_df.drop(columns=unnamed, inplace=True)
+
+    ## to_numpy with a fixed dtype avoids np.array's object-dtype upcast
+    ## and skips the copy entirely when the frame is already float64
+    entities_df = make_entity_df(
+        entities_df.to_numpy(dtype=np.float64, copy=False), flipxy=flipxy
     )
-
-    entities_df = make_entity_df(np.array(entities_df), flipxy=flipxy)
     logger.debug(
         f"Loaded entities {entities_df.shape} applying scale {scale} and offset {offset} and crop start {crop_start}, crop_end {crop_end}"
     )
-    tabledata = []
     entities_df["z"] = (entities_df["z"] * scale) + offset[0]
     entities_df["x"] = (entities_df["x"] * scale) + offset[1]
     entities_df["y"] = (entities_df["y"] * scale) + offset[2]
 
-    print("-" * 100)
-
-    if index_column:
-        logger.debug("Loading pts")
-        for i in range(len(entities_df)):
-            entry = (
-                i,  # entities_df.iloc[i]["index"],
-                entities_df.iloc[i]["z"],
-                entities_df.iloc[i]["x"],
-                entities_df.iloc[i]["y"],
-                0,
-            )
-            tabledata.append(entry)
-
-    else:
-        logger.debug("Loading entities")
-        for i in range(len(entities_df)):
-            entry = (
-                i,
-                entities_df.iloc[i]["z"],
-                entities_df.iloc[i]["x"],
-                entities_df.iloc[i]["y"],
-                entities_df.iloc[i]["class_code"],
-            )
-            tabledata.append(entry)
-
-    tabledata = np.array(
-        tabledata,
+    ## build the structured array column-at-a-time: each assignment is a
+    ## single C-level copy instead of five iloc lookups per row
+    n = len(entities_df)
+    tabledata = np.empty(
+        n,
         dtype=[
             ("index", int),
             ("z", float),
@@ -85,6 +70,16 @@ def setup_entity_table(
             ("class_code", int),
         ],
     )
+    tabledata["index"] = np.arange(n)
+    tabledata["z"] = entities_df["z"].to_numpy()
+    tabledata["x"] = entities_df["x"].to_numpy()
+    tabledata["y"] = entities_df["y"].to_numpy()
+    if index_column:
+        logger.debug("Loading pts")
+        tabledata["class_code"] = 0
+    else:
+        logger.debug("Loading entities")
+        tabledata["class_code"] = entities_df["class_code"].to_numpy(dtype=int)
 
     logger.debug(f"Loaded {len(tabledata)} entities.")
     return tabledata, entities_df
@@ -99,66 +94,37 @@ def setup_bb_table(
     crop_end=(MAX_SIZE, MAX_SIZE, MAX_SIZE),
     flipxy=True,
 ):
-    if entities_df == None:
-        print(f"Reading entity csv: {entities_fullname}")
-        entities_df = pd.read_csv(entities_fullname)
-        print(entities_df)
+    ## == None on a DataFrame broadcasts elementwise and raises on the
+    ## truth test; identity is also just a pointer compare
+    if entities_df is None:
+        logger.debug(f"Reading entity csv: {entities_fullname}")
+        ## skip pandas' autosaved "Unnamed: 0" index columns at parse time
+        ## instead of allocating them and dropping them afterwards
+        entities_df = pd.read_csv(
+            entities_fullname, usecols=lambda c: not c.lower().startswith("unnamed")
+        )
+        ## lazy: head() is only rendered when debug logging is enabled
+        logger.opt(lazy=True).debug("Entity dataframe:\n{df}", df=lambda: str(entities_df.head()))
 
     # otherwise ignore filename
-    index_column = len([col for col in entities_df.columns if "index" in col]) > 0
-    print(index_column)
-    entities_df.drop(
-        entities_df.columns[entities_df.columns.str.contains("unnamed", case=False)],
-        axis=1,
-        inplace=True,
+    cols_lower = {col.lower(): col for col in entities_df.columns}
+    index_column = any("index" in k for k in cols_lower)
+    logger.debug(f"index_column: {index_column}")
+    unnamed = [cols_lower[k] for k in cols_lower if "unnamed" in k]
+    if unnamed:
+        entities_df.drop(columns=unnamed, inplace=True)
+
+    entities_df = make_entity_boxes(
+        entities_df.to_numpy(dtype=np.float64, copy=False), flipxy=flipxy
     )
-
-    entities_df = make_entity_boxes(np.array(entities_df), flipxy=flipxy)
     logger.debug(
         f"Loaded entities {entities_df.shape} applying scale {scale} and offset {offset} and crop start {crop_start}, crop_end {crop_end}"
     )
-    tabledata = []
-
-    print("-" * 100)
-
-    if index_column:
-        logger.debug("Loading pts")
-        for i in range(len(entities_df)):
-            entry = (
-                i,  # entities_df.iloc[i]["index"],
-                entities_df.iloc[i]["z"],
-                entities_df.iloc[i]["x"],
-                entities_df.iloc[i]["y"],
-                entities_df.iloc[i]["bb_s_z"],
-                entities_df.iloc[i]["bb_s_x"],
-                entities_df.iloc[i]["bb_s_y"],
-                entities_df.iloc[i]["bb_f_z"],
-                entities_df.iloc[i]["bb_f_x"],
-                entities_df.iloc[i]["bb_f_y"],
-                0,
-            )
-            tabledata.append(entry)
-
-    else:
-        logger.debug("Loading entities")
-        for i in range(len(entities_df)):
-            entry = (
-                i,
-                entities_df.iloc[i]["class_code"],
-                entities_df.iloc[i]["z"],
-                entities_df.iloc[i]["x"],
-                entities_df.iloc[i]["y"],
-                entities_df.iloc[i]["bb_s_z"],
-                entities_df.iloc[i]["bb_s_x"],
-                entities_df.iloc[i]["bb_s_y"],
-                entities_df.iloc[i]["bb_f_z"],
-                entities_df.iloc[i]["bb_f_x"],
-                entities_df.iloc[i]["bb_f_y"],
-            )
-            tabledata.append(entry)
-
-    tabledata = np.array(
-        tabledata,
+    ## assign the structured array column-at-a-time; no per-row tuples and
+    ## no second pass boxing them back into the structured dtype
+    n = len(entities_df)
+    tabledata = np.empty(
+        n,
         dtype=[
             ("index", int),
             ("class_code", int),
@@ -173,6 +139,15 @@ def setup_bb_table(
             ("bb_f_y", float),
         ],
     )
+    tabledata["index"] = np.arange(n)
+    for name in ("z", "x", "y", "bb_s_z", "bb_s_x", "bb_s_y", "bb_f_z", "bb_f_x", "bb_f_y"):
+        tabledata[name] = entities_df[name].to_numpy()
+    if index_column:
+        logger.debug("Loading pts")
+        tabledata["class_code"] = 0
+    else:
+        logger.debug("Loading entities")
+        tabledata["class_code"] = entities_df["class_code"].to_numpy(dtype=int)
 
     logger.debug(f"Loaded {len(tabledata)} box entities.")
     return tabledata, entities_df
@@ -188,15 +163,71 @@ class SmallVolWidget:
         self.imv.jumpFrames(smallvol.shape[0] // 2)
 
 
+class EntityTableModel(QAbstractTableModel):
+    """Table model backed directly by a NumPy structured array.
+
+    Unlike the item-based table, no QTableWidgetItem is allocated per
+    cell: the view only asks for the handful of visible cells and the
+    rest of the data stays in the array. For tables with tens of
+    thousands of entities this is the difference between an instant and
+    a multi-second load."""
+
+    def __init__(self, arr=None, parent=None):
+        super().__init__(parent)
+        self._arr = arr if arr is not None else np.empty(0, dtype=[("index", int)])
+        self._fields = list(self._arr.dtype.names or ())
+
+    def set_array(self, arr):
+        self.beginResetModel()
+        self._arr = arr
+        self._fields = list(arr.dtype.names or ())
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return len(self._arr)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self._fields)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return str(self._arr[index.row()][self._fields[index.column()]])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            if orientation == Qt.Orientation.Horizontal:
+                return self._fields[section]
+            return str(section)
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if not self._fields or len(self._arr) == 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        idx = np.argsort(self._arr[self._fields[column]], kind="stable")
+        if order == Qt.SortOrder.DescendingOrder:
+            idx = idx[::-1]
+        self._arr = self._arr[idx]
+        self.layoutChanged.emit()
+
+    def rowValues(self, row):
+        return self._arr[row]
+
+
 # have to inherit from QGraphicsObject in order for signal to work
 class TableWidget(QtWidgets.QGraphicsObject):
     clientEvent = Signal(object)
 
     def __init__(self):
         super().__init__()
-        self.w = Table.TableWidget()
+        self.model = EntityTableModel()
+        self.w = QtWidgets.QTableView()
+        self.w.setModel(self.model)
+        self.w.setSortingEnabled(True)
+        self.w.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
         self.w.hide()
-        self.w.cellClicked.connect(self.cell_clicked)
+        self.w.clicked.connect(self._index_clicked)
         self.w.doubleClicked.connect(self.double_clicked)
         self.w.selected_row = 0
         self.w.selected_item = None
@@ -204,35 +235,37 @@ class TableWidget(QtWidgets.QGraphicsObject):
         # self.w.setStyleSheet(stylesheet)
 
     def set_data(self, data):
-        self.w.setData(data)
+        if isinstance(data, dict):
+            ## columnar input (dict of equal-length arrays): assemble the
+            ## structured array column-by-column, one C-level copy per
+            ## field and no per-row Python work
+            names = list(data.keys())
+            cols = [np.asarray(c) for c in data.values()]
+            arr = np.empty(len(cols[0]), dtype=[(nm, c.dtype) for nm, c in zip(names, cols)])
+            for nm, c in zip(names, cols):
+                arr[nm] = c
+            data = arr
+        self.model.set_array(data)
+        self.w.resizeColumnsToContents()
         self.w.show()
         self.tabledata = data
 
     def double_clicked(self):
         row_idx = self.w.selected_row
-
-        print(self.w.selected_item.data(0))
-
-        print(self.row_data)
+        logger.debug(f"Double clicked row {row_idx}: {self.row_data}")
 
         _, z, x, y = self.row_data
         z = int(float(z))
         x = int(float(x))
         y = int(float(y))
-        # z, x, y = (
-        #     self.tabledata["z"][row_idx],
-        #     self.tabledata["x"][row_idx],
-        #     self.tabledata["y"][row_idx],
-        # )
         cfg.ppw.clientEvent.emit({"source": "table", "data": "show_roi", "selected_roi": (z, x, y)})
 
-        for index in self.w.selectedIndexes():
-            logger.debug(f"Retrieved item from table: {self.w.model().data(index)}")
+    def _index_clicked(self, index):
+        self.cell_clicked(index.row(), index.column())
 
     def cell_clicked(self, row, col):
         logger.debug("Row %d and Column %d was clicked" % (row, col))
         self.w.selected_row = row
-        self.w.selected_item = self.w.item(row, col)
-        self.row_data = []
-        for i in range(4):
-            self.row_data.append(self.w.item(row, i).text())
+        rowVals = self.model.rowValues(row)
+        self.w.selected_item = rowVals
+        self.row_data = [str(rowVals[f]) for f in self.model._fields[:4]]
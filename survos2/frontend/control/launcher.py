@@ -186,7 +186,9 @@ class Launcher(QtCore.QObject):
         p.daemon = True
         p.start()
         while p.is_alive():
-            QtWidgets.QApplication.processEvents()
+            # bounded pump: returns as soon as the queue is empty and caps
+            # a flood of events at 100ms so the join check is never starved
+            QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 100)
             p.join(0.1)
         return queue.get()
 
@@ -19,7 +19,12 @@ from survos2.frontend.control.launcher import Launcher
 from survos2.frontend.paint_strokes import paint_strokes
 from survos2.frontend.panels import ButtonPanelWidget, PluginPanelWidget
 from survos2.frontend.transfer_fn import _transfer_features_http, _transfer_labels, _transfer_points
-from survos2.frontend.utils import get_array_from_dataset, get_color_mapping
+from survos2.frontend.utils import (
+    get_array_from_dataset,
+    get_color_mapping,
+    get_levels_cached,
+    invalidate_levels_cache,
+)
 from survos2.frontend.view_fn import (
     get_level_from_server,
     remove_layer,
@@ -145,7 +150,7 @@ def frontend(viewer):
         else:
             src = DataModel.g.dataset_uri(msg["level_id"], group="annotations")
             with DatasetManager(src, out=None, dtype="float32", fillvalue=0) as DM:
-                src_annotations_dataset = DM.sources[0][:]
+                src_annotations_dataset = DM.sources[0]
                 src_arr = get_array_from_dataset(src_annotations_dataset)
             update_annotation_layer_in_viewer(msg["level_id"], src_arr)
 
@@ -189,9 +194,7 @@ def frontend(viewer):
                             }
                         )
 
-                result = Launcher.g.run(
-                    "annotations", "get_levels", workspace=DataModel.g.current_workspace
-                )
+                result = get_levels_cached(DataModel.g.current_workspace)
 
                 if result:
                     return _refresh_annotations_in_viewer(result, msg, src_arr)
@@ -376,6 +379,7 @@ def frontend(viewer):
                 workspace=DataModel.g.current_workspace,
                 name=cfg.current_annotation_name,
             )
+            invalidate_levels_cache(DataModel.g.current_workspace)
         else:
             logger.info("save_annotation couldn't find annotation in viewer")
 
@@ -386,7 +390,12 @@ def frontend(viewer):
         with progress(total=1) as pbar:
             pbar.set_description("Transferring layer")
             logger.debug(f"transfer_layer {msg}")
-            selected_layer = viewer.layers.selection.pop()
+            # peek at the selection rather than pop(), which silently
+            # deselects the layer as a side effect
+            selected_layer = next(iter(viewer.layers.selection), None)
+            if selected_layer is None:
+                logger.debug("No layer selected.")
+                return
 
             if isinstance(selected_layer, Labels):
                 transfer_function = _transfer_labels
@@ -439,81 +448,95 @@ def frontend(viewer):
         viewer.dims.set_current_step(0, z)
         viewer.camera.zoom = 4
 
+    def _remove_layer(msg):
+        remove_layer(viewer, msg["layer_name"])
+
+    def _view_feature(msg):
+        view_feature(viewer, msg)
+
+    def _view_pipeline(msg):
+        view_pipeline(viewer, msg, analyzers=msg["source"] == "analyzer")
+
+    def _view_regions(msg):
+        view_regions(viewer, msg)
+
+    def _view_objects(msg):
+        view_objects(viewer, msg)
+
+    def _run_workflow(msg):
+        run_workflow_worker = run_workflow(msg)
+        run_workflow_worker.start()
+        processEvents({"data": "faster_refresh"})
+
+    def _refresh(msg):
+        params = dict(workspace=DataModel.g.current_workspace)
+        result = Launcher.g.run("workspace", "set_workspace", **params)
+        logger.debug("Refreshing plugin panel")
+        dw.ppw.setup()
+
+    def _faster_refresh(msg):
+        logger.debug("Faster refresh")
+        dw.ppw.setup_fast()
+
+    def _refresh_chroot(msg):
+        logger.debug("Refresh chroot")
+        dw.bpw.refresh_workspaces()
+
+    def _refresh_plugin(msg):
+        logger.debug("Refresh plugin")
+        dw.ppw.setup_named_plugin(msg["plugin_name"])
+
+    def _faster_refresh_plugin(msg):
+        logger.debug("Refresh plugin")
+        dw.ppw.faster_setup_named_plugin(msg["plugin_name"])
+
+    def _empty_viewer(msg):
+        logger.debug("\n\nEmptying viewer")
+        for l in viewer.layers:
+            viewer.layers.remove(l)
+        # some bug does not allow to remove all layers at once
+        for l in viewer.layers:
+            viewer.layers.remove(l)
+        cfg.current_feature_name = "001_raw"
+        cfg.current_annotation_name = None
+        cfg.current_pipeline_name = None
+        cfg.current_regions_name = None
+        cfg.current_analyzers_name = None
+
+    # message name -> handler; one dict lookup per event instead of a
+    # linear string-compare walk over every message type
+    event_handlers = {
+        "refesh_annotations": refresh_annotations_in_viewer,
+        "paint_annotations": paint_annotations,
+        "update_annotations": update_annotations,
+        "remove_layer": _remove_layer,
+        "view_feature": _view_feature,
+        "view_pipeline": _view_pipeline,
+        "view_regions": _view_regions,
+        "view_objects": _view_objects,
+        "view_patches": view_patches,
+        "show_roi": show_roi,
+        "run_workflow": _run_workflow,
+        "refresh": _refresh,
+        "faster_refresh": _faster_refresh,
+        "refresh_chroot": _refresh_chroot,
+        "refresh_plugin": _refresh_plugin,
+        "faster_refresh_plugin": _faster_refresh_plugin,
+        "empty_viewer": _empty_viewer,
+        "save_annotation": save_annotation,
+        "set_paint_params": set_paint_params,
+        "set_session": set_session,
+        "set_workspace": set_workspace,
+        "get_crop": get_crop,
+        "make_roi_ws": make_roi_ws,
+        "transfer_layer": transfer_layer,
+    }
+
     def processEvents(msg):
         "Main event handling function uses the message to update the viewer"
-        if msg["data"] == "refesh_annotations":
-            refresh_annotations_in_viewer(msg)
-        elif msg["data"] == "paint_annotations":
-            paint_annotations(msg)
-        elif msg["data"] == "update_annotations":
-            update_annotations(msg)
-        elif msg["data"] == "remove_layer":
-            layer_name = msg["layer_name"]
-            remove_layer(viewer, layer_name)
-        elif msg["data"] == "view_feature":
-            view_feature(viewer, msg)
-        elif msg["data"] == "view_pipeline":
-            if msg["source"] == "analyzer":
-                view_pipeline(viewer, msg, analyzers=True)
-            else:
-                view_pipeline(viewer, msg)
-        elif msg["data"] == "view_regions":
-            view_regions(viewer, msg)
-        elif msg["data"] == "view_objects":
-            view_objects(viewer, msg)
-        elif msg["data"] == "view_patches":
-            view_patches(msg)
-        elif msg["data"] == "show_roi":
-            show_roi(msg)
-        elif msg["data"] == "run_workflow":
-            run_workflow_worker = run_workflow(msg)
-            run_workflow_worker.start()
-            processEvents({"data": "faster_refresh"})
-        elif msg["data"] == "refresh":
-            params = dict(workspace=DataModel.g.current_workspace)
-            result = Launcher.g.run("workspace", "set_workspace", **params)
-            logger.debug("Refreshing plugin panel")
-            dw.ppw.setup()
-        elif msg["data"] == "faster_refresh":
-            logger.debug("Faster refresh")
-            dw.ppw.setup_fast()
-        elif msg["data"] == "refresh_chroot":
-            logger.debug("Refresh chroot")
-            dw.bpw.refresh_workspaces()
-        elif msg["data"] == "refresh_plugin":
-            plugin_name = msg["plugin_name"]
-            logger.debug("Refresh plugin")
-            dw.ppw.setup_named_plugin(plugin_name)
-        elif msg["data"] == "faster_refresh_plugin":
-            plugin_name = msg["plugin_name"]
-            logger.debug("Refresh plugin")
-            dw.ppw.faster_setup_named_plugin(plugin_name)
-        elif msg["data"] == "empty_viewer":
-            logger.debug("\n\nEmptying viewer")
-            for l in viewer.layers:
-                viewer.layers.remove(l)
-            # some bug does not allow to remove all layers at once
-            for l in viewer.layers:
-                viewer.layers.remove(l)
-            cfg.current_feature_name = "001_raw"
-            cfg.current_annotation_name = None
-            cfg.current_pipeline_name = None
-            cfg.current_regions_name = None
-            cfg.current_analyzers_name = None
-        elif msg["data"] == "save_annotation":
-            save_annotation(msg)
-        elif msg["data"] == "set_paint_params":
-            set_paint_params(msg)
-        elif msg["data"] == "set_session":
-            set_session(msg)
-        elif msg["data"] == "set_workspace":
-            set_workspace(msg)
-        elif msg["data"] == "get_crop":
-            get_crop(msg)
-        elif msg["data"] == "make_roi_ws":
-            make_roi_ws(msg)
-        elif msg["data"] == "transfer_layer":
-            transfer_layer(msg)
+        handler = event_handlers.get(msg["data"])
+        if handler is not None:
+            handler(msg)
 
     # setup message based event handling mechanism and return it to the dockwidget
     dw.ppw.clientEvent.connect(lambda x: processEvents(x))
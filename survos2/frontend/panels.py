@@ -9,27 +9,20 @@ from survos2.frontend.control import Launcher
 from PyQt5.QtWidgets import (
     QGridLayout,
     QGroupBox,
-    QHBoxLayout,
     QLabel,
     QLineEdit,
     QPushButton,
-    QRadioButton,
     QTabWidget,
     QVBoxLayout,
     QWidget,
 )
-from qtpy.QtWidgets import QFileDialog, QGridLayout, QGroupBox, QLabel
+from qtpy.QtWidgets import QFileDialog
 from vispy import scene
-from survos2.frontend.components.base import HWidgets, Slider
-from survos2.frontend.plugins.base import list_plugins, get_plugin, PluginContainer, register_plugin
+from survos2.frontend.plugins.base import list_plugins, get_plugin, PluginContainer
 from survos2.frontend.components.base import (
     VBox,
-    Label,
     HWidgets,
     PushButton,
-    SWidget,
-    clear_layout,
-    QCSWidget,
     ComboBox,
 )
 from survos2.frontend.plugins.features import MplCanvas
@@ -448,20 +441,29 @@ class PluginPanelWidget(QtWidgets.QWidget):
         vbox.addWidget(self.pluginContainer)
         self.setLayout(vbox)
 
-        for plugin_name in list_plugins():
-            plugin = get_plugin(plugin_name)
-            name = plugin["name"]
-            title = plugin["title"]
-            plugin_cls = plugin["cls"]  # full classname
-            tab = plugin["tab"]
-
-            logger.debug(f"Plugin loaded: {name}, {title}, {plugin_cls}")
-            self.pluginContainer.load_plugin(name, title, plugin_cls)
-            self.pluginContainer.show_plugin(name, tab)
+        # Plugin widgets are instantiated on first show rather than up
+        # front: constructing and setting up every plugin here dominated
+        # frontend launch time, and paid for plugins that may never be
+        # opened. Only the registry metadata is collected eagerly.
+        self._plugin_specs = {name: get_plugin(name) for name in list_plugins()}
 
-        logger.debug(f"Plugins loaded: {list_plugins()}")
+        logger.debug(f"Plugins registered: {list_plugins()}")
         self.cfg = cfg  # access in survos console: viewer.window._dock_widgets['Workspace'].children()[4].cfg
 
+    def _show_plugin(self, plugin_name, fast=False):
+        """Show a plugin, instantiating its widget on first access."""
+        plugin = self._plugin_specs[plugin_name]
+        first_load = plugin_name not in self.pluginContainer.plugins
+        if first_load:
+            logger.debug(f"Plugin loaded: {plugin_name}, {plugin['title']}, {plugin['cls']}")
+            self.pluginContainer.load_plugin(plugin_name, plugin["title"], plugin["cls"])
+        if fast and not first_load:
+            self.pluginContainer.show_plugin_fast(plugin_name, plugin["tab"])
+        else:
+            # a freshly created widget needs the full show to be attached
+            # to its tab, even on the fast paths
+            self.pluginContainer.show_plugin(plugin_name, plugin["tab"])
+
     def setup(self):
         with progress(total=len(list_plugins())) as pbar:
             pbar.set_description("Refreshing viewer")
@@ -469,10 +471,7 @@ class PluginPanelWidget(QtWidgets.QWidget):
 
             for plugin_name in list_plugins():
                 pbar.update(1)
-                plugin = get_plugin(plugin_name)
-                name = plugin["name"]
-                tab = plugin["tab"]
-                self.pluginContainer.show_plugin(name, tab)
+                self._show_plugin(plugin_name)
 
         for l in cfg.viewer.layers:
             cfg.viewer.layers.remove(l)
@@ -480,28 +479,16 @@ class PluginPanelWidget(QtWidgets.QWidget):
 
     def setup_fast(self):
         for plugin_name in list_plugins():
-            plugin = get_plugin(plugin_name)
-            name = plugin["name"]
-            tab = plugin["tab"]
-            self.pluginContainer.show_plugin_fast(name, tab)
+            self._show_plugin(plugin_name, fast=True)
 
     def setup_features(self):
-        plugin = get_plugin("features")
-        name = plugin["name"]
-        tab = plugin["tab"]
-        self.pluginContainer.show_plugin_fast(name, tab)
+        self._show_plugin("features", fast=True)
 
     def setup_named_plugin(self, name):
-        plugin = get_plugin(name)
-        name = plugin["name"]
-        tab = plugin["tab"]
-        self.pluginContainer.show_plugin(name, tab)
+        self._show_plugin(name)
 
     def faster_setup_named_plugin(self, name):
-        plugin = get_plugin(name)
-        name = plugin["name"]
-        tab = plugin["tab"]
-        self.pluginContainer.show_plugin_fast(name, tab)
+        self._show_plugin(name, fast=True)
 
     def switch_tab_index(self, index):
         self.pluginContainer.tabwidget.setCurrentIndex(index)
@@ -37,7 +37,13 @@ def _transfer_features(selected_layer):
     logger.debug(f"Created new object in workspace {fid}, {ftype}, {fname}")
     result = DataModel.g.dataset_uri(fid, group="features")
     with DatasetManager(result, out=result, dtype="float32", fillvalue=0) as DM:
-        DM.out[:] = selected_layer.data
+        # stream slab-by-slab along z, aligned to the output chunking,
+        # rather than pushing the whole volume through in one write
+        data = selected_layer.data
+        chunk_size = getattr(DM.out, "chunk_size", None)
+        step = chunk_size[0] if chunk_size else len(data)
+        for z0 in range(0, data.shape[0], step):
+            DM.out[z0 : z0 + step] = data[z0 : z0 + step]
     return result
 
 
@@ -1,4 +1,5 @@
 import os
+import time
 
 import numpy as np
 from matplotlib import pyplot as plt
@@ -43,11 +44,22 @@ def remove_masked_pts(bg_mask, entities):
 
 
 def get_array_from_dataset(src_dataset, axis=0):
+    """Materialize the part of a dataset the viewer needs.
+
+    Accepts either an ndarray or a lazy (HDF5/SuRVoS) dataset. In slice
+    mode only the currently displayed plane is read, instead of copying
+    and transposing the full volume to pull a single slice out of it; in
+    volume mode the dataset is read exactly once.
+    """
     if cfg.retrieval_mode == "slice":
-        print(f"src_dataset shape {src_dataset.shape}")
-        dataset = src_dataset.copy(order="C")
-        dataset = np.transpose(dataset, np.array(cfg.order)).astype(np.float32)
-        src_arr = dataset[cfg.current_slice, :, :]
+        logger.debug(f"src_dataset shape {src_dataset.shape}")
+        order = tuple(cfg.order)
+        index = [slice(None)] * 3
+        index[order[0]] = int(cfg.current_slice)
+        src_arr = np.asarray(src_dataset[tuple(index)], dtype=np.float32)
+        # the two in-plane axes come back in their on-disk order
+        if order[1] > order[2]:
+            src_arr = src_arr.T
     elif cfg.retrieval_mode == "volume" or cfg.retrieval_mode == "volume_http":
         src_arr = src_dataset[:]
 
@@ -56,7 +68,11 @@ def get_array_from_dataset(src_dataset, axis=0):
 
 class WorkerThread(QThread):
     def run(self):
-        def work():
+        # The refresh is scheduled with a single-shot timer rather than a
+        # blocking QThread.sleep in the callback: sleeping stalls this
+        # thread's event loop, delaying the next periodic save and any
+        # queued signals.
+        def emit_save():
             cfg.ppw.clientEvent.emit(
                 {
                     "source": "save_annotation",
@@ -64,13 +80,15 @@ class WorkerThread(QThread):
                     "value": None,
                 }
             )
+            QTimer.singleShot(10000, emit_refresh)
+
+        def emit_refresh():
             cfg.ppw.clientEvent.emit(
                 {"source": "save_annotation", "data": "refresh", "value": None}
             )
-            QThread.sleep(10)
 
         timer = QTimer()
-        timer.timeout.connect(work)
+        timer.timeout.connect(emit_save)
         timer.start(50000)
         self.exec_()
 
@@ -88,28 +106,90 @@ def coords_in_view(coords, image_shape):
 
 
 def hex_string_to_rgba(hex_string):
-    hex_value = hex_string.lstrip("#")
-    rgba_array = (
-        np.append(np.array([int(hex_value[i : i + 2], 16) for i in (0, 2, 4)]), 255.0) / 255.0
-    )
-    return rgba_array
+    """Decode a single '#rrggbb' string to a length-4 float rgba array.
+
+    Single branchless pass over the ascii bytes (see hex_strings_to_rgba)
+    instead of three Python int(..., 16) calls plus an np.append.
+    """
+    ascii_bytes = np.frombuffer(hex_string.lstrip("#")[:6].encode("ascii"), dtype=np.uint8)
+    nibbles = (ascii_bytes & 0x0F) + 9 * (ascii_bytes >> 6)
+    rgba = np.empty(4, dtype=np.float64)
+    rgba[:3] = (nibbles[::2] * 16 + nibbles[1::2]) / 255.0
+    rgba[3] = 1.0
+    return rgba
+
+
+def hex_strings_to_rgba(hex_strings):
+    """Decode a sequence of '#rrggbb' strings to an (N, 4) float rgba array.
+
+    All colors are decoded in one vectorized pass over the raw ascii bytes:
+    ``(c & 0x0F) + 9 * (c >> 6)`` maps both digits and hex letters to their
+    nibble value, so no per-color Python ``int(..., 16)`` calls are needed.
+    """
+    joined = "".join(s.lstrip("#")[:6] for s in hex_strings)
+    ascii_bytes = np.frombuffer(joined.encode("ascii"), dtype=np.uint8).reshape(-1, 6)
+    nibbles = (ascii_bytes & 0x0F) + 9 * (ascii_bytes >> 6)
+    rgb = nibbles[:, ::2] * 16 + nibbles[:, 1::2]
+    rgba = np.empty((len(rgb), 4), dtype=np.float64)
+    rgba[:, :3] = rgb / 255.0
+    rgba[:, 3] = 1.0
+    return rgba
+
+
+# Short-lived cache of get_levels results per workspace. view_pipeline,
+# paint_annotations and the periodic WorkerThread refresh each run the same
+# Launcher round-trip within one event burst; one request every couple of
+# seconds is enough. Invalidated explicitly when an annotation is saved.
+_LEVELS_TTL = 2.0
+_levels_cache = {}
+
+
+def get_levels_cached(workspace):
+    """Fetch the annotation levels of a workspace with a short TTL cache."""
+    from survos2.frontend.control.launcher import Launcher
+
+    entry = _levels_cache.get(workspace)
+    now = time.monotonic()
+    if entry is not None and now - entry[0] < _LEVELS_TTL:
+        return entry[1]
+    result = Launcher.g.run("annotations", "get_levels", workspace=workspace)
+    if result:
+        _levels_cache[workspace] = (now, result)
+    return result
+
+
+def invalidate_levels_cache(workspace=None):
+    if workspace is None:
+        _levels_cache.clear()
+    else:
+        _levels_cache.pop(workspace, None)
+
+
+# Decoded colormaps memoized per (level, label colors). The labels of a level
+# rarely change between view events, but get_color_mapping runs on every
+# view_pipeline/paint_annotations refresh, including the periodic ones fired
+# by WorkerThread.
+_cmapping_cache = {}
 
 
 def get_color_mapping(result, level_id="001_level"):
     logger.debug(f"Getting color mapping for level {level_id}")
-    labels = []
     for r in result:
         if r["kind"] == "level":
             if r["id"] == level_id:
-                cmapping = {}
-                for ii, (k, v) in enumerate(r["labels"].items()):
-                    labels.append(ii)
-                    remapped_label = int(k) - 1
-                    cmapping[remapped_label] = hex_string_to_rgba(v["color"])
-                    cmapping[remapped_label + (remapped_label * 16)] = hex_string_to_rgba(
-                        v["color"]
-                    )
-                return cmapping, labels
+                key = (level_id, tuple((k, v["color"]) for k, v in r["labels"].items()))
+                cached = _cmapping_cache.get(key)
+                if cached is None:
+                    cmapping = {}
+                    rgba = hex_strings_to_rgba([v["color"] for v in r["labels"].values()])
+                    for color, k in zip(rgba, r["labels"]):
+                        remapped_label = int(k) - 1
+                        cmapping[remapped_label] = color
+                        cmapping[remapped_label + (remapped_label * 16)] = color
+                    labels = list(range(len(r["labels"])))
+                    cached = _cmapping_cache[key] = (cmapping, labels)
+                cmapping, labels = cached
+                return dict(cmapping), list(labels)
 
 
 def resource(*args):
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from survos2.entity.entities import make_entity_df
 from loguru import logger
 import numpy as np
@@ -6,11 +8,23 @@ from survos2.model import DataModel, Workspace
 from survos2.frontend.control.launcher import Launcher
 from survos2.server.state import cfg
 from survos2.utils import decode_numpy, decode_numpy_slice
-from survos2.frontend.utils import get_array_from_dataset, get_color_mapping
+from survos2.frontend.utils import get_array_from_dataset, get_color_mapping, get_levels_cached
 from survos2.frontend.components.entity import setup_entity_table
 from skimage.segmentation import find_boundaries
 from skimage import img_as_ubyte
 import seaborn as sns
+from napari.qt.threading import thread_worker
+
+
+@lru_cache(maxsize=32)
+def _hls_palette(num_classes):
+    """Cached hls palette as an (n, 3) float array.
+
+    seaborn builds hls palettes color-by-color through colorsys, so the
+    result is memoized per class count rather than rebuilt on every
+    view_objects event. Callers index, never mutate, the cached array.
+    """
+    return np.array(sns.color_palette("hls", num_classes))
 
 
 def get_level_from_server(msg, retrieval_mode="volume"):
@@ -34,12 +48,28 @@ def get_level_from_server(msg, retrieval_mode="volume"):
     elif retrieval_mode == "volume":  # get entire volume
         src = DataModel.g.dataset_uri(msg["level_id"], group="annotations")
         with DatasetManager(src, out=None, dtype="float32", fillvalue=0) as DM:
-            src_annotations_dataset = DM.sources[0][:]
+            # read lazily: get_array_from_dataset only pulls what it needs
+            src_annotations_dataset = DM.sources[0]
             src_arr = get_array_from_dataset(src_annotations_dataset)
 
     return src_arr, src_annotations_dataset
 
 
+def build_pyramid(src_arr, max_levels=4, min_side=256):
+    """Build a coarse-to-fine multiscale list for napari.
+
+    Each level is a 2x stride-downsample of the previous one, so napari
+    only renders the level matching the current zoom instead of decoding
+    the full-resolution volume when zoomed out. Striding keeps the build
+    to one O(N/8) copy per level with no extra dependencies. Stops once a
+    level drops below min_side voxels on its smallest axis.
+    """
+    pyramid = [src_arr]
+    while len(pyramid) < max_levels and min(pyramid[-1].shape) >= 2 * min_side:
+        pyramid.append(np.ascontiguousarray(pyramid[-1][::2, ::2, ::2]))
+    return pyramid
+
+
 def remove_layer(viewer, layer_name):
     logger.debug(f"Removing layer {layer_name}")
     existing_layer = [v for v in viewer.layers if v.name == layer_name]
@@ -47,6 +77,13 @@ def remove_layer(viewer, layer_name):
         viewer.layers.remove(existing_layer[0])
 
 
+@thread_worker
+def _load_feature_volume(src):
+    with DatasetManager(src, out=None, dtype="float32", fillvalue=0) as DM:
+        src_arr = get_array_from_dataset(DM.sources[0])
+        return np.nan_to_num(src_arr)
+
+
 def view_feature(viewer, msg, new_name=None):
     logger.debug(f"view_feature {msg['feature_id']}")
     existing_feature_layer = [v for v in viewer.layers if v.name == msg["feature_id"]]
@@ -67,7 +104,7 @@ def view_feature(viewer, msg, new_name=None):
             src_arr = decode_numpy_slice(result)
 
             if len(existing_feature_layer) > 0:
-                existing_feature_layer[0].data = src_arr.copy()
+                existing_feature_layer[0].data = src_arr
             else:
                 if new_name:
                     viewer.add_image(src_arr, name=new_name)
@@ -89,7 +126,7 @@ def view_feature(viewer, msg, new_name=None):
             cfg.base_dataset_shape = src_arr.shape
             cfg.slice_max = cfg.base_dataset_shape[0]
             if len(existing_feature_layer) > 0:
-                existing_feature_layer[0].data = src_arr.copy()
+                existing_feature_layer[0].data = src_arr
             else:
                 if new_name:
                     viewer.add_image(src_arr, name=new_name)
@@ -103,19 +140,25 @@ def view_feature(viewer, msg, new_name=None):
         remove_layer(viewer, cfg.current_feature_name)
         cfg.current_feature_name = msg["feature_id"]
 
-        with DatasetManager(src, out=None, dtype="float32", fillvalue=0) as DM:
-            src_dataset = DM.sources[0][:]
-            src_arr = get_array_from_dataset(src_dataset)
-            src_arr = np.nan_to_num(src_arr)
+        def add_feature_to_viewer(src_arr):
             cfg.base_dataset_shape = src_arr.shape
             cfg.slice_max = cfg.base_dataset_shape[0]
-            if new_name:
-                viewer.add_image(src_arr, name=new_name)
+            # hand napari a pyramid for big volumes so zoomed-out rendering
+            # touches the coarse levels only
+            if src_arr.ndim == 3 and src_arr.nbytes > (1 << 28):
+                image_data = build_pyramid(src_arr)
             else:
-                viewer.add_image(src_arr, name=msg["feature_id"])
-
+                image_data = src_arr
+            viewer.add_image(image_data, name=new_name if new_name else msg["feature_id"])
             cfg.bpw.display_histogram_plot(src_arr.ravel())
 
+        # read the dataset off the Qt main thread so a multi-GB volume
+        # doesn't freeze the viewer; the layer is added back on the main
+        # thread when the worker returns, as with paint_strokes
+        worker = _load_feature_volume(src)
+        worker.returned.connect(add_feature_to_viewer)
+        worker.start()
+
 
 def view_regions(viewer, msg):
     logger.debug(f"view_feature {msg['region_id']}")
@@ -139,7 +182,7 @@ def view_regions(viewer, msg):
             src_arr = decode_numpy(result)
             src_arr = find_boundaries(src_arr) * 1.0
             if len(existing_regions_layer) > 0:
-                existing_regions_layer[0].data = src_arr.copy()
+                existing_regions_layer[0].data = src_arr
                 existing_regions_layer[0].opacity = region_opacity
             else:
                 sv_layer = viewer.add_image(src_arr, name=region_name)
@@ -158,7 +201,7 @@ def view_regions(viewer, msg):
             src_arr = decode_numpy(result)
             # src_arr = find_boundaries(src_arr) * 1.0
             if len(existing_regions_layer) > 0:
-                existing_regions_layer[0].data = src_arr.copy()
+                existing_regions_layer[0].data = src_arr
                 existing_regions_layer[0].opacity = region_opacity
             else:
                 sv_layer = viewer.add_image(src_arr, name=region_name)
@@ -167,7 +210,7 @@ def view_regions(viewer, msg):
     elif cfg.retrieval_mode == "volume":
         src = DataModel.g.dataset_uri(region_name, group="superregions")
         with DatasetManager(src, out=None, dtype="uint32", fillvalue=0) as DM:
-            src_dataset = DM.sources[0][:]
+            src_dataset = DM.sources[0]
             src_arr = get_array_from_dataset(src_dataset)
             existing_layer = [v for v in viewer.layers if v.name == region_name]
 
@@ -195,9 +238,7 @@ def view_pipeline(viewer, msg, analyzers=False):
         logger.debug(f"view_pipeline {msg['pipeline_id']} using {msg['level_id']}")
         source = msg["source"]
 
-        result = Launcher.g.run(
-            "annotations", "get_levels", workspace=DataModel.g.current_workspace
-        )
+        result = get_levels_cached(DataModel.g.current_workspace)
 
         if result:
             cmapping, _ = get_color_mapping(result, level_id=msg["level_id"])
@@ -226,7 +267,7 @@ def view_pipeline(viewer, msg, analyzers=False):
             if result:
                 src_arr = decode_numpy(result)
                 if len(existing_pipeline_layer) > 0:
-                    existing_pipeline_layer[0].data = src_arr.astype(np.uint32).copy()
+                    existing_pipeline_layer[0].data = src_arr.astype(np.uint32)
                 else:
                     viewer.add_labels(
                         src_arr.astype(np.uint32),
@@ -239,7 +280,7 @@ def view_pipeline(viewer, msg, analyzers=False):
             if result:
                 src_arr = decode_numpy(result)
                 if len(existing_pipeline_layer) > 0:
-                    existing_pipeline_layer[0].data = src_arr.astype(np.uint32).copy()
+                    existing_pipeline_layer[0].data = src_arr.astype(np.uint32)
                 else:
                     viewer.add_labels(
                         src_arr.astype(np.uint32),
@@ -248,7 +289,7 @@ def view_pipeline(viewer, msg, analyzers=False):
                     )
         elif cfg.retrieval_mode == "volume":
             with DatasetManager(pipeline_src, out=None, dtype="uint32", fillvalue=0) as DM:
-                src_dataset = DM.sources[0][:]
+                src_dataset = DM.sources[0]
                 src_arr = get_array_from_dataset(src_dataset)
                 existing_layer = [v for v in viewer.layers if v.name == msg["pipeline_id"]]
 
@@ -256,7 +297,7 @@ def view_pipeline(viewer, msg, analyzers=False):
                     logger.debug(
                         f"Removing existing layer and re-adding it with new colormapping. {existing_layer}"
                     )
-                    existing_layer[0].data = src_arr.astype(np.uint32).copy()
+                    existing_layer[0].data = src_arr.astype(np.uint32)
                 else:
                     viewer.add_labels(
                         src_arr.astype(np.uint32),
@@ -290,25 +331,30 @@ def view_objects(viewer, msg):
         entities_df=entities_df,
         flipxy=msg["flipxy"],
     )
-    sel_start, sel_end = 0, len(entities_df)
-
-    centers = np.array(
-        [
-            [
-                int((float(entities_df.iloc[i]["z"]) * 1.0) + 0),
-                int((float(entities_df.iloc[i]["x"]) * 1.0) + 0),
-                int((float(entities_df.iloc[i]["y"]) * 1.0) + 0),
-            ]
-            for i in range(sel_start, sel_end)
-        ]
-    )
+    # one vectorized cast per column instead of a per-row iloc/float/int loop
+    centers = entities_df[["z", "x", "y"]].to_numpy(dtype=np.float64).astype(np.int64, copy=False)
 
     num_classes = max(9, len(np.unique(entities_df["class_code"]))) + 2
 
     logger.debug(f"Number of entity classes {num_classes}")
-    palette = np.array(sns.color_palette("hls", num_classes))
-    face_color_list = [palette[class_code] for class_code in entities_df["class_code"]]
-
-    entity_layer = viewer.add_points(
-        centers, size=[10] * len(centers), opacity=0.5, face_color=face_color_list
-    )
+    palette = _hls_palette(num_classes)
+    face_color_list = palette[entities_df["class_code"].to_numpy(dtype=int)]
+
+    # preallocated ndarray: napari converts Python size lists element-wise
+    sizes = np.full(len(centers), 10, dtype=np.float32)
+    existing_objects_layer = [v for v in viewer.layers if v.name == msg["objects_id"]]
+    if len(existing_objects_layer) > 0:
+        # update in place rather than stacking another (auto-named) points
+        # layer on every view event, which leaks the previous layer's data
+        entity_layer = existing_objects_layer[0]
+        entity_layer.data = centers
+        entity_layer.size = sizes
+        entity_layer.face_color = face_color_list
+    else:
+        entity_layer = viewer.add_points(
+            centers,
+            name=msg["objects_id"],
+            size=sizes,
+            opacity=0.5,
+            face_color=face_color_list,
+        )
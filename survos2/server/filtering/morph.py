@@ -3,66 +3,72 @@ from scipy import ndimage
 from loguru import logger
 from skimage.morphology import skeletonize as skeletonize_skimage
 
+# 18-connected structuring element shared by the binary ops below; built
+# once at import instead of on every call
+_struct_3d = ndimage.generate_binary_structure(3, 2)
 
-def erode(I, num_iter, thresh=0.5):
-    I -= np.min(I)
-    I = I / np.max(I)
-    I = (I >= thresh) * 1.0
 
-    struct2 = ndimage.generate_binary_structure(3, 2)
+def _normalized_threshold(I, thresh):
+    """Threshold `I` at `thresh` of its normalized range in a single pass.
 
-    for i in range(num_iter):
-        I = ndimage.binary_erosion(I, structure=struct2).astype(I.dtype)
+    Equivalent to min-max normalizing and comparing against `thresh`, but
+    without materializing the shifted and divided float volumes: only the
+    two reductions and one comparison touch the data, and the caller's
+    array is no longer mutated in place.
+    """
+    mn = I.min()
+    mx = I.max()
+    if mx == mn:
+        return np.zeros(I.shape, dtype=bool)
+    return I >= mn + thresh * (mx - mn)
 
-    I = I.astype("int")
-    print(I)
-    I = np.nan_to_num(I)
-    return I.astype("int")
 
+def erode(I, num_iter, thresh=0.5):
+    I = _normalized_threshold(I, thresh)
 
-def dilate(I, num_iter, thresh=0.5):
-    I -= np.min(I)
-    I = I / np.max(I)
-    I = (I >= thresh) * 1.0
+    # let ndimage run all iterations in C instead of bouncing through a
+    # float array once per iteration; num_iter < 1 stays a no-op, since
+    # scipy would read iterations < 1 as iterate-until-convergence
+    if num_iter >= 1:
+        I = ndimage.binary_erosion(I, structure=_struct_3d, iterations=num_iter)
 
-    struct2 = ndimage.generate_binary_structure(3, 2)
+    return np.nan_to_num(I.astype("int"))
 
-    for i in range(num_iter):
-        I = ndimage.binary_dilation(I, structure=struct2).astype(I.dtype)
 
-    return np.nan_to_num(I)
+def dilate(I, num_iter, thresh=0.5):
+    I = _normalized_threshold(I, thresh)
 
+    # see the note in erode() about num_iter < 1
+    if num_iter >= 1:
+        I = ndimage.binary_dilation(I, structure=_struct_3d, iterations=num_iter)
 
-def opening(I, num_iter, thresh=0.5):
-    I -= np.min(I)
-    I = I / np.max(I)
-    I = (I >= thresh) * 1.0
+    return np.nan_to_num(I.astype(np.float64))
 
-    struct2 = ndimage.generate_binary_structure(3, 2)
 
-    for i in range(num_iter):
-        I = ndimage.binary_opening(I, structure=struct2).astype(I.dtype)
+def opening(I, num_iter, thresh=0.5):
+    I = _normalized_threshold(I, thresh)
 
-    return I
+    # opening is idempotent, so num_iter successive openings equal one;
+    # note binary_opening's `iterations` means n erosions then n dilations
+    # (and < 1 means iterate to convergence), which is a different filter
+    if num_iter >= 1:
+        I = ndimage.binary_opening(I, structure=_struct_3d)
+
+    return I.astype(np.float64)
 
 
 def closing(I, num_iter, thresh=0.5):
-    I -= np.min(I)
-    I = I / np.max(I)
-    I = (I >= thresh) * 1.0
+    I = _normalized_threshold(I, thresh)
 
-    struct2 = ndimage.generate_binary_structure(3, 2)
+    # closing is idempotent; see the note in opening() about `iterations`
+    if num_iter >= 1:
+        I = ndimage.binary_closing(I, structure=_struct_3d)
 
-    for i in range(num_iter):
-        I = ndimage.binary_closing(I, structure=struct2).astype(I.dtype)
-
-    return I
+    return I.astype(np.float64)
 
 
 def distance_transform_edt(I, thresh=0.5):
-    I -= np.min(I)
-    I = I / np.max(I)
-    I = (I >= thresh) * 1.0
+    I = _normalized_threshold(I, thresh)
 
     I = ndimage.distance_transform_edt(I)
 
@@ -94,9 +100,7 @@ def median(I, median_size, num_iter, thresh=0.5):
 
 
 def skeletonize(I, thresh=0.5):
-    I -= np.min(I)
-    I = I / np.max(I)
-    I = (I >= thresh) * 1.0
+    I = _normalized_threshold(I, thresh)
     skeleton = skeletonize_skimage(I)  # returns 0-255
     skeleton = (skeleton > 0) * 1.0
 
@@ -63,3 +63,18 @@ def test_sample_marked_patches():
     assert result.vols.shape == (5, 4, 4, 4)
     result.vols_pts.shape[0] == 5
     result.vols_pts[0][0] == [1, 1, 1, 0]
+
+
+def test_sample_marked_patches_boundary_locs():
+    img_vol = np.ones((64, 70, 80))
+    pts = grid_of_points(img_vol, (4, 4, 4), (16, 16, 16))
+    img_volume = np.random.random((64, 70, 80))
+    locs = np.array(
+        [[0, 0, 0, 0], [-5, -5, -5, 0], [63, 79, 69, 0], [10, 78, 2, 0], [2, 1, 68, 0]]
+    )
+    result = sample_marked_patches(img_volume, locs, pts, patch_size=(16, 16, 16))
+    assert result.vols.shape == (5, 16, 16, 16)
+    assert np.all(result.vols_bbs >= 0)
+    assert np.all(result.vols_bbs[:, 1] <= img_volume.shape[0])
+    assert np.all(result.vols_bbs[:, 3] <= img_volume.shape[2])
+    assert np.all(result.vols_bbs[:, 5] <= img_volume.shape[1])